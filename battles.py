@@ -0,0 +1,344 @@
+import logging
+import math
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import db
+import lcapi
+from scheduler import PRIORITY_BACKGROUND
+import state
+from util import handle_battle_result
+
+log = logging.getLogger(__name__)
+
+BATTLE_TTL = 60 * 40
+# (battle age, seconds between polls), polled often early and less later on
+POLL_INTERVALS = (
+    (60 * 5, 20),
+    (60 * 15, 60),
+    (BATTLE_TTL, 120),
+)
+
+
+class TimerWheel:
+    def __init__(self, resolution: float = 1, sizes=(60, 60, 24)):
+        self.resolution = resolution
+        self.sizes = sizes
+        # ticks covered by one slot on each level
+        self.widths = [math.prod(sizes[:i]) for i in range(len(sizes))]
+        self.span = math.prod(sizes)
+        self.levels = [[set() for _ in range(size)] for size in sizes]
+        self.deadlines: Dict[object, int] = {}
+        self.slots: Dict[object, set] = {}
+        self.current = int(time.time() / resolution)
+
+    def schedule(self, item, expires_at: float):
+        self.cancel(item)
+        self.deadlines[item] = max(
+            math.ceil(expires_at / self.resolution), self.current + 1
+        )
+        self.place(item)
+
+    def place(self, item):
+        deadline = self.deadlines[item]
+        ticks = min(deadline - self.current, self.span - 1)
+        for level, size in enumerate(self.sizes):
+            if ticks < self.widths[level] * size:
+                break
+
+        # anything past the top level parks in its last slot and cascades again
+        tick = min(deadline, self.current + ticks)
+        slot = self.levels[level][(tick // self.widths[level]) % size]
+        slot.add(item)
+        self.slots[item] = slot
+
+    def cancel(self, item):
+        slot = self.slots.pop(item, None)
+        if slot is not None:
+            slot.discard(item)
+        self.deadlines.pop(item, None)
+
+    def advance(self, now: float):
+        expired = []
+        target = int(now / self.resolution)
+        if target - self.current >= self.span:
+            # stepping through a whole rotation tick by tick is pointless
+            return self.rebuild(target)
+
+        while self.current < target:
+            self.current += 1
+            for level in range(1, len(self.sizes)):
+                if self.current % self.widths[level]:
+                    break
+
+                slot = self.levels[level][
+                    (self.current // self.widths[level]) % self.sizes[level]
+                ]
+                cascading = list(slot)
+                slot.clear()
+                for item in cascading:
+                    self.place(item)
+
+            slot = self.levels[0][self.current % self.sizes[0]]
+            for item in list(slot):
+                if self.deadlines[item] <= self.current:
+                    slot.discard(item)
+                    self.slots.pop(item)
+                    self.deadlines.pop(item)
+                    expired.append(item)
+
+        return expired
+
+    def rebuild(self, target: int):
+        expired = [item for item, tick in self.deadlines.items() if tick <= target]
+        for item in expired:
+            self.cancel(item)
+
+        for level in self.levels:
+            for slot in level:
+                slot.clear()
+        self.slots.clear()
+        self.current = target
+        for item in self.deadlines:
+            self.place(item)
+
+        return expired
+
+
+class Battle:
+    __slots__ = (
+        "id_a",
+        "id_b",
+        "problem_slug",
+        "problem_difficulty",
+        "has_noob",
+        "channel_id",
+        "started_at",
+        "expires_at",
+    )
+
+    def __init__(
+        self,
+        id_a: int,
+        id_b: int,
+        problem_slug: str,
+        problem_difficulty: str,
+        has_noob: bool,
+        channel_id: Optional[int],
+        started_at: float,
+        expires_at: float,
+    ):
+        self.id_a = id_a
+        self.id_b = id_b
+        self.problem_slug = problem_slug
+        self.problem_difficulty = problem_difficulty
+        self.has_noob = has_noob
+        self.channel_id = channel_id
+        self.started_at = started_at
+        self.expires_at = expires_at
+
+    @property
+    def key(self):
+        return (self.id_a, self.id_b)
+
+    def opponent(self, user_id: int):
+        return self.id_b if user_id == self.id_a else self.id_a
+
+    def to_state(self):
+        return [
+            self.problem_slug,
+            self.problem_difficulty,
+            self.has_noob,
+            self.channel_id,
+            self.started_at,
+        ]
+
+
+def poll_interval(battle: Battle, now: float):
+    age = now - battle.started_at
+    for max_age, interval in POLL_INTERVALS:
+        if age < max_age:
+            return interval
+    return POLL_INTERVALS[-1][1]
+
+
+def earliest_submission(battle: Battle, submissions: Optional[list]):
+    timestamps = [
+        int(submission["timestamp"])
+        for submission in submissions or []
+        if submission["titleSlug"] == battle.problem_slug
+        and int(submission["timestamp"]) >= battle.started_at
+    ]
+    return min(timestamps, default=None)
+
+
+def find_winner(battle: Battle, submissions: Dict[int, Optional[list]]):
+    solved_at = {
+        user_id: earliest_submission(battle, submissions.get(user_id))
+        for user_id in battle.key
+    }
+    solved_at = {user_id: ts for user_id, ts in solved_at.items() if ts is not None}
+    if not solved_at:
+        return None
+
+    return min(solved_at, key=solved_at.get)
+
+
+class BattleRegistry:
+    def __init__(self, kind: str = "battles"):
+        self.kind = kind
+        self.by_user: Dict[int, Battle] = {}
+        self.wheel = TimerWheel()
+        self.callbacks: List[Callable] = []
+        self.resolve_callbacks: List[Callable] = []
+        self.next_poll: Dict[Tuple[int, int], float] = {}
+        state.stores[kind] = self
+
+    def __len__(self):
+        return len(self.by_user) // 2
+
+    def __iter__(self):
+        return iter({battle.key: battle for battle in self.by_user.values()}.values())
+
+    def get(self, user_id: int) -> Optional[Battle]:
+        return self.by_user.get(user_id)
+
+    def track(self, battle: Battle):
+        self.by_user[battle.id_a] = battle
+        self.by_user[battle.id_b] = battle
+        self.wheel.schedule(battle, battle.expires_at)
+
+    def add(
+        self,
+        id_a: int,
+        id_b: int,
+        problem_slug: str,
+        problem_difficulty: str,
+        has_noob: bool,
+        channel_id: Optional[int] = None,
+    ):
+        now = time.time()
+        battle = Battle(
+            id_a,
+            id_b,
+            problem_slug,
+            problem_difficulty,
+            has_noob,
+            channel_id,
+            now,
+            now + BATTLE_TTL,
+        )
+        self.track(battle)
+        key = state.encode(battle.key)
+        state.watch(
+            db.put_state(
+                self.kind, key, state.encode(battle.to_state()), battle.expires_at
+            ),
+            "save",
+            self.kind,
+            key,
+        )
+        return battle
+
+    def is_active(self, battle: Battle):
+        return self.by_user.get(battle.id_a) is battle
+
+    def untrack(self, battle: Battle):
+        for user_id in battle.key:
+            if self.by_user.get(user_id) is battle:
+                del self.by_user[user_id]
+        self.next_poll.pop(battle.key, None)
+
+    def remove(self, battle: Battle):
+        self.untrack(battle)
+        self.wheel.cancel(battle)
+        key = state.encode(battle.key)
+        state.watch(db.delete_state(self.kind, key), "delete", self.kind, key)
+
+    async def resolve(self, battle: Battle, winner_id: int):
+        # whoever gets here first settles the battle, /submit and the poller can race
+        if not self.is_active(battle):
+            return None
+        self.remove(battle)
+
+        if battle.has_noob:
+            return "Nothing happens because one of the users was a Leetcode **Noob**.\n"
+
+        loser_id = battle.opponent(winner_id)
+        return await handle_battle_result(
+            await db.get_info(winner_id),
+            await db.get_info(loser_id),
+            battle.problem_difficulty,
+            winner_id,
+            loser_id,
+        )
+
+    async def get_submissions(self, battles: List[Battle], priority: int):
+        handles = {}
+        for battle in battles:
+            for user_id in battle.key:
+                info = await db.get_info(user_id)
+                if info:
+                    handles[user_id] = info["leetcode_handle"]
+
+        recent_acs = await lcapi.get_recent_acs(
+            list(set(handles.values())), priority=priority
+        )
+        return {user_id: recent_acs.get(handle) for user_id, handle in handles.items()}
+
+    def restore(self, key, value, expires_at: float):
+        self.track(Battle(*key, *value, expires_at))
+
+    def expire(self, now: float):
+        # the timer wheel already expires battles on its own
+        pass
+
+    def on_expire(self, callback: Callable):
+        self.callbacks.append(callback)
+        return callback
+
+    def on_resolve(self, callback: Callable):
+        self.resolve_callbacks.append(callback)
+        return callback
+
+    async def poll(self):
+        now = time.time()
+        due = [battle for battle in self if self.next_poll.get(battle.key, 0) <= now]
+        if not due:
+            return
+
+        for battle in due:
+            self.next_poll[battle.key] = now + poll_interval(battle, now)
+
+        submissions = await self.get_submissions(due, PRIORITY_BACKGROUND)
+        for battle in due:
+            winner_id = find_winner(battle, submissions)
+            if winner_id is None:
+                continue
+
+            result_msg = await self.resolve(battle, winner_id)
+            if result_msg is None:
+                continue
+
+            for callback in self.resolve_callbacks:
+                try:
+                    await callback(battle, winner_id, result_msg)
+                except Exception:
+                    log.exception("Battle resolve callback failed")
+
+    async def tick(self):
+        expired = self.wheel.advance(time.time())
+        if not expired:
+            return
+
+        for battle in expired:
+            self.untrack(battle)
+
+        for callback in self.callbacks:
+            try:
+                await callback(expired)
+            except Exception:
+                log.exception("Battle expiry callback failed")
+
+
+registry = BattleRegistry()
@@ -0,0 +1,242 @@
+import asyncio
+import math
+import random
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from consts import RANK_VALUE
+import db
+
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+PROBLEMS_PER_DIFFICULTY = 300
+DAILY_SLUG = "two-sum"
+
+
+def handle_for(discord_id: int):
+    return f"user{discord_id}"
+
+
+def create_schema(path: str):
+    # same files db.migrate() applies, recorded so db.init() has nothing to do
+    conn = sqlite3.connect(path)
+    conn.execute(db.SCHEMA_MIGRATIONS_TABLE)
+    for version, migration in db.get_migrations():
+        with open(migration) as f:
+            conn.executescript(f.read())
+        conn.execute(
+            "INSERT INTO schema_migrations (version, applied_at) VALUES (?, ?)",
+            (version, int(time.time())),
+        )
+    conn.commit()
+    conn.close()
+
+
+def seed_users(path: str, users: int, rng: random.Random, batch: int = 10000):
+    ranks = list(RANK_VALUE)
+    conn = sqlite3.connect(path)
+    for start in range(1, users + 1, batch):
+        conn.executemany(
+            "INSERT INTO users (discord_id, leetcode_handle, rank, tickets, easies, mediums, hards, champion_lp, wins, losses)"
+            + " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    discord_id,
+                    handle_for(discord_id),
+                    rank,
+                    rng.randint(0, 1000),
+                    rng.randint(0, 500),
+                    rng.randint(0, 500),
+                    rng.randint(0, 200),
+                    rng.randint(0, 300) if rank == "Champion" else 0,
+                    rng.randint(0, 50),
+                    rng.randint(0, 50),
+                )
+                for discord_id in range(start, min(start + batch, users + 1))
+                for rank in [rng.choice(ranks)]
+            ],
+        )
+    conn.commit()
+    conn.close()
+
+
+def seed_problems(path: str, rng: random.Random):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO problems (title_slug, title, difficulty, ac_rate, paid_only, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (
+                f"{difficulty.lower()}-{i}",
+                f"{difficulty} Problem {i}",
+                difficulty,
+                rng.uniform(20, 80),
+                rng.random() < 0.2,
+                int(time.time()),
+            )
+            for difficulty in DIFFICULTIES
+            for i in range(PROBLEMS_PER_DIFFICULTY)
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+def daily_start(days_ago: int):
+    today = int(time.time()) // 86400 * 86400
+    return today - days_ago * 86400
+
+
+def streak_row(discord_id: int, claimed: List[int]):
+    # same rollup as the daily_streaks migration, for claims seeded after it ran
+    current = best = 0
+    for i, start_time in enumerate(claimed):
+        if i and start_time == claimed[i - 1] + 86400:
+            current += 1
+        else:
+            current = 1
+        best = max(best, current)
+    return (discord_id, claimed[-1], current, best, len(claimed))
+
+
+def seed_daily_claims(
+    path: str,
+    users: int,
+    days: int,
+    claim_ratio: float,
+    rng: random.Random,
+    batch: int = 10000,
+):
+    conn = sqlite3.connect(path)
+    for start in range(1, users + 1, batch):
+        claims = {
+            discord_id: [
+                daily_start(days_ago)
+                for days_ago in range(days, 0, -1)
+                if rng.random() < claim_ratio
+            ]
+            for discord_id in range(start, min(start + batch, users + 1))
+        }
+        conn.executemany(
+            "INSERT INTO daily_claims (discord_id, daily_start_time) VALUES (?, ?)",
+            [
+                (discord_id, start_time)
+                for discord_id, claimed in claims.items()
+                for start_time in claimed
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO daily_streaks (discord_id, last_claimed, current_streak, best_streak, total_claims)"
+            + " VALUES (?, ?, ?, ?, ?)",
+            [
+                streak_row(discord_id, claimed)
+                for discord_id, claimed in claims.items()
+                if claimed
+            ],
+        )
+    conn.commit()
+    conn.close()
+
+
+def create_database(
+    path: str,
+    users: int,
+    seed: int = 0,
+    claim_days: int = 0,
+    claim_ratio: float = 0.0,
+):
+    rng = random.Random(seed)
+    create_schema(path)
+    seed_users(path, users, rng)
+    seed_problems(path, rng)
+    if claim_days:
+        seed_daily_claims(path, users, claim_days, claim_ratio, rng)
+
+
+def percentile(samples: List[float], p: float):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, math.ceil(p * len(samples)) - 1)]
+
+
+def summarize(samples: List[float]):
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 3) if samples else None,
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3) if samples else None,
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3) if samples else None,
+        "max_ms": round(max(samples) * 1000, 3) if samples else None,
+    }
+
+
+class FakeLeetCodeSession:
+    # answers lcapi queries in process, so benchmarks don't need leetcode.com
+    def __init__(self, latency: float = 0.05, solved_ratio: float = 0.5, seed: int = 0):
+        self.latency = latency
+        self.solved_ratio = solved_ratio
+        self.rng = random.Random(seed)
+        self.calls: Dict[str, int] = {}
+        # handle -> slug that shows up as their latest accepted submission
+        self.solved: Dict[str, str] = {}
+
+    async def execute(self, query, variables=None, extra_args=None):
+        operation = query.definitions[0].name.value
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.rng.expovariate(1 / self.latency))
+
+        variables = variables or {}
+        aliases = {key: value for key, value in variables.items() if key[1:].isdigit()}
+        if operation == "batchRecentAcSubmissions":
+            return {alias: self.recent_acs(handle) for alias, handle in aliases.items()}
+        if operation == "batchUserQuestionProgress":
+            return {alias: self.progress(handle) for alias, handle in aliases.items()}
+        if operation == "recentAcSubmissions":
+            return {"recentAcSubmissionList": self.recent_acs(variables["username"])}
+        if operation == "userProfileUserQuestionProgressV2":
+            return {
+                "userProfileUserQuestionProgressV2": self.progress(
+                    variables["userSlug"]
+                )
+            }
+        if operation == "userPublicProfile":
+            return {"matchedUser": {"profile": {"aboutMe": ""}}}
+        if operation == "questionOfToday":
+            return {"activeDailyCodingChallengeQuestion": self.daily_question()}
+        if operation == "problemsetQuestionList":
+            return {"problemsetQuestionList": {"total": 0, "questions": []}}
+        raise ValueError(f"Unknown operation {operation}")
+
+    def daily_question(self):
+        return {
+            "date": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+            "link": f"/problems/{DAILY_SLUG}/",
+            "question": {"acRate": 55.0, "difficulty": "Easy", "titleSlug": DAILY_SLUG},
+        }
+
+    def progress(self, handle: str):
+        return {
+            "numAcceptedQuestions": [
+                {"difficulty": "EASY", "count": self.rng.randint(0, 500)},
+                {"difficulty": "MEDIUM", "count": self.rng.randint(0, 500)},
+                {"difficulty": "HARD", "count": self.rng.randint(0, 200)},
+            ]
+        }
+
+    def recent_acs(self, handle: str):
+        now = int(time.time())
+        submissions = [
+            {
+                "id": str(now * 100 - i),
+                "title": f"Problem {i}",
+                "titleSlug": f"medium-{self.rng.randrange(PROBLEMS_PER_DIFFICULTY)}",
+                "timestamp": str(now - i * 60),
+            }
+            for i in range(15)
+        ]
+        if handle in self.solved:
+            submissions[0]["titleSlug"] = self.solved[handle]
+        elif self.rng.random() < self.solved_ratio:
+            submissions[0]["titleSlug"] = DAILY_SLUG
+        return submissions
@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import db
+
+from bench.common import create_database, daily_start, summarize
+
+DEFAULT_SIZES = "10000,100000,1000000"
+DATA_DIR = os.path.join(tempfile.gettempdir(), "lcc-bench")
+# statements that only manage the writer's transactions
+IGNORED_STATEMENTS = re.compile(
+    r"^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|PRAGMA)", re.I
+)
+
+
+def schema_version():
+    digest = hashlib.sha256()
+    for _, migration in db.get_migrations():
+        with open(migration, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def prepare_database(args, users: int):
+    # generating a million users is slow, keep pristine copies around per schema
+    os.makedirs(args.data_dir, exist_ok=True)
+    name = (
+        f"users-{users}-days-{args.claim_days}-seed-{args.seed}-{schema_version()}.db"
+    )
+    pristine = os.path.join(args.data_dir, name)
+    if args.regenerate or not os.path.exists(pristine):
+        started = time.perf_counter()
+        if os.path.exists(pristine):
+            os.remove(pristine)
+        create_database(
+            pristine + ".tmp",
+            users,
+            args.seed,
+            claim_days=args.claim_days,
+            claim_ratio=args.claim_ratio,
+        )
+        os.replace(pristine + ".tmp", pristine)
+        print(
+            f"Generated {users} users in {time.perf_counter() - started:.1f}s",
+            file=sys.stderr,
+        )
+
+    working = os.path.join(args.data_dir, f"run-{os.getpid()}-{users}.db")
+    shutil.copyfile(pristine, working)
+    return working
+
+
+async def time_op(samples: List[float], func, *args):
+    started = time.perf_counter()
+    await func(*args)
+    samples.append(time.perf_counter() - started)
+
+
+async def bench_reads(users: int, iterations: int, rng: random.Random):
+    results: Dict[str, List[float]] = {
+        name: []
+        for name in (
+            "get_info",
+            "get_info_cached",
+            "get_leaderboard",
+            "get_leaderboard_cached",
+            "check_daily_claimed",
+            "find_daily_claim",
+        )
+    }
+    for _ in range(iterations):
+        discord_id = rng.randint(1, users)
+        db.user_cache.clear()
+        await time_op(results["get_info"], db.get_info, discord_id)
+        await time_op(results["get_info_cached"], db.get_info, discord_id)
+
+        db.invalidate_leaderboard()
+        await time_op(results["get_leaderboard"], db.get_leaderboard, discord_id)
+        await time_op(results["get_leaderboard_cached"], db.get_leaderboard, discord_id)
+
+        await time_op(
+            results["check_daily_claimed"],
+            db.check_daily_claimed,
+            discord_id,
+            daily_start(rng.randint(0, 30)),
+        )
+        # older days skip the streak shortcut and read the claim history
+        await time_op(
+            results["find_daily_claim"],
+            db.find_daily_claim,
+            discord_id,
+            daily_start(rng.randint(1, 30)),
+        )
+    return results
+
+
+async def bench_concurrent_reads(users: int, iterations: int, rng: random.Random):
+    # uncached reads all at once, these spread over the read pool
+    reads = {
+        "get_info": lambda: db.load_user(rng.randint(1, users)),
+        "get_leaderboard": lambda: db.get_leaderboard_rank(rng.randint(1, users)),
+        "check_daily_claimed": lambda: db.check_daily_claimed(
+            rng.randint(1, users), daily_start(rng.randint(0, 30))
+        ),
+    }
+    throughput: Dict[str, float] = {}
+    for name, read in reads.items():
+        started = time.perf_counter()
+        await asyncio.gather(*[read() for _ in range(iterations)])
+        throughput[name] = round(iterations / (time.perf_counter() - started), 1)
+    return throughput
+
+
+def writers(users: int, rng: random.Random):
+    new_ids = iter(range(users + 1, users * 2 + 2))
+    lc_info = {"EASY": 10, "MEDIUM": 5, "HARD": 1}
+    return {
+        "link_id": lambda: db.link_id(next(new_ids), "bench", lc_info),
+        "set_rank": lambda: db.set_rank(rng.randint(1, users), "Master"),
+        "set_lp": lambda: db.set_lp(rng.randint(1, users), rng.randint(0, 300)),
+        "set_tickets": lambda: db.set_tickets(
+            rng.randint(1, users), rng.randint(0, 1000)
+        ),
+        "set_wins": lambda: db.set_wins(rng.randint(1, users), rng.randint(0, 50)),
+        "set_losses": lambda: db.set_losses(rng.randint(1, users), rng.randint(0, 50)),
+        "claim_daily": lambda: db.claim_daily(
+            rng.randint(1, users), daily_start(0), 10
+        ),
+    }
+
+
+async def bench_writes(users: int, iterations: int, rng: random.Random):
+    latency: Dict[str, List[float]] = {}
+    throughput: Dict[str, float] = {}
+    for name, write in writers(users, rng).items():
+        # one at a time, each caller pays the group commit window
+        samples = latency[name] = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await write()
+            samples.append(time.perf_counter() - started)
+
+        # all at once, the writer batches them into few commits
+        started = time.perf_counter()
+        await asyncio.gather(*[write() for _ in range(iterations)])
+        throughput[name] = round(iterations / (time.perf_counter() - started), 1)
+    return latency, throughput
+
+
+async def capture_statements(users: int, rng: random.Random):
+    statements = []
+
+    def trace(statement: str):
+        if not IGNORED_STATEMENTS.match(statement):
+            statements.append(statement)
+
+    # reads go through the pool, so watch every connection
+    connections = [db.db, *db.readers]
+    for conn in connections:
+        await conn.set_trace_callback(trace)
+    try:
+        discord_id = rng.randint(1, users)
+        db.user_cache.clear()
+        db.invalidate_leaderboard()
+        await db.get_info(discord_id)
+        await db.get_leaderboard(discord_id)
+        await db.check_daily_claimed(discord_id, daily_start(1))
+        await db.find_daily_claim(discord_id, daily_start(2))
+        for write in writers(users, rng).values():
+            await write()
+    finally:
+        for conn in connections:
+            await conn.set_trace_callback(None)
+    return list(dict.fromkeys(statements))
+
+
+def check_plans(path: str, statements: List[str]):
+    conn = sqlite3.connect(path)
+    plans = []
+    for statement in statements:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}")]
+        # a bare "SCAN table" reads every row, an index scan or search is fine
+        problems = [
+            step
+            for step in plan
+            if re.fullmatch(r"SCAN \w+", step) or "TEMP B-TREE" in step
+        ]
+        plans.append(
+            {"sql": statement, "plan": plan, "ok": not problems, "problems": problems}
+        )
+    conn.close()
+    return plans
+
+
+async def bench_size(args, users: int):
+    path = prepare_database(args, users)
+    rng = random.Random(args.seed)
+    await db.init(path)
+    try:
+        reads = await bench_reads(users, args.iterations, rng)
+        concurrent_reads = await bench_concurrent_reads(users, args.iterations, rng)
+        latency, throughput = await bench_writes(users, args.write_iterations, rng)
+        statements = await capture_statements(users, rng)
+    finally:
+        await db.close()
+        db.user_cache.clear()
+        db.invalidate_leaderboard()
+
+    plans = check_plans(path, statements)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    return {
+        "reads": {name: summarize(samples) for name, samples in reads.items()},
+        "concurrent_reads_per_second": concurrent_reads,
+        "writes": {
+            name: {**summarize(samples), "concurrent_per_second": throughput[name]}
+            for name, samples in latency.items()
+        },
+        "plans": plans,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    if args.read_pool_size:
+        db.READ_POOL_SIZE = args.read_pool_size
+    report = {
+        "commit": git_commit(),
+        "schema": schema_version(),
+        "read_pool_size": db.READ_POOL_SIZE,
+        "iterations": args.iterations,
+        "sizes": {},
+    }
+    for users in args.sizes:
+        report["sizes"][str(users)] = await bench_size(args, users)
+
+    output = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    failed = [
+        (users, plan)
+        for users, result in report["sizes"].items()
+        for plan in result["plans"]
+        if not plan["ok"]
+    ]
+    for users, plan in failed:
+        print(
+            f"[{users} users] full scan: {plan['sql']}\n  {plan['problems']}",
+            file=sys.stderr,
+        )
+    return 1 if failed else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Time db.py reads and writes on large synthetic databases and check their query plans."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[int(size) for size in DEFAULT_SIZES.split(",")],
+        help="comma separated user counts",
+    )
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--write-iterations", type=int, default=200)
+    parser.add_argument(
+        "--claim-days", type=int, default=30, help="days of daily_claims history"
+    )
+    parser.add_argument(
+        "--claim-ratio",
+        type=float,
+        default=0.3,
+        help="chance a user claimed on a given day",
+    )
+    parser.add_argument(
+        "--read-pool-size",
+        type=int,
+        default=None,
+        help="override DB_READ_POOL_SIZE",
+    )
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument(
+        "--regenerate", action="store_true", help="rebuild the cached databases"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report here instead of stdout")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
@@ -0,0 +1,89 @@
+import asyncio
+import itertools
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import discord
+
+ids = itertools.count(10**17)
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.avatar = None
+        self.mention = f"<@{user_id}>"
+
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction", latency: float):
+        self.interaction = interaction
+        self.latency = latency
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def send_message(self, content=None, **kwargs):
+        if self.done:
+            raise discord.InteractionResponded(self.interaction)
+        self.done = True
+        await asyncio.sleep(self.latency)
+        self.interaction.sent.append((content, kwargs))
+
+    async def defer(self, **kwargs):
+        if self.done:
+            raise discord.InteractionResponded(self.interaction)
+        self.done = True
+        await asyncio.sleep(self.latency)
+        self.interaction.deferred = True
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction", latency: float):
+        self.interaction = interaction
+        self.latency = latency
+
+    async def send(self, content=None, **kwargs):
+        if not self.interaction.response.done:
+            raise RuntimeError("Followup sent before the interaction was answered")
+        await asyncio.sleep(self.latency)
+        self.interaction.sent.append((content, kwargs))
+
+
+class FakeInteraction:
+    # just enough of discord.Interaction for the command callbacks and DeadlineTree
+    def __init__(
+        self,
+        user_id: int,
+        command,
+        channel_id: int = 1,
+        guild_id: int = 1,
+        latency: float = 0.0,
+    ):
+        self.id = next(ids)
+        self.user = FakeUser(user_id)
+        self.command = command
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.type = discord.InteractionType.application_command
+        self.created_at = datetime.now(timezone.utc)
+        self.permissions = discord.Permissions.none()
+        self.extras = {}
+        self.data = {}
+        self.sent: List[tuple] = []
+        self.deferred = False
+        self.deleted_original = False
+        self.response = FakeResponse(self, latency)
+        self.followup = FakeFollowup(self, latency)
+
+    async def delete_original_response(self):
+        self.deleted_original = True
+
+    def view(self) -> Optional[discord.ui.View]:
+        for _, kwargs in self.sent:
+            if kwargs.get("view"):
+                return kwargs["view"]
+        return None
@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+from collections import defaultdict
+import json
+import random
+import time
+from typing import Dict, List
+
+import lcapi
+import metrics
+from scheduler import PRIORITY_INTERACTIVE
+
+from bench.common import summarize
+from bench.leetcode_server import FIXTURES_DIR, Fixtures, StandIn, start
+
+SCENARIOS = ("profile", "solve_count", "solve_counts", "recent_ac", "daily")
+
+
+async def run_scenario(name: str, handles: List[str], rng: random.Random):
+    handle = rng.choice(handles)
+    if name == "profile":
+        await lcapi.get_profile_summary(handle)
+    elif name == "solve_count":
+        await lcapi.get_solve_count(handle, priority=PRIORITY_INTERACTIVE)
+    elif name == "solve_counts":
+        await lcapi.get_solve_counts(rng.sample(handles, min(len(handles), 50)))
+    elif name == "recent_ac":
+        await lcapi.get_recent_ac(handle)
+    elif name == "daily":
+        await lcapi.get_daily_question()
+
+
+async def run_load(args, handles: List[str]):
+    rng = random.Random(args.seed)
+    samples: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    remaining = args.requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            name = rng.choice(args.scenarios)
+            started = time.perf_counter()
+            try:
+                await run_scenario(name, handles, rng)
+            except Exception:
+                errors[name] += 1
+            samples[name].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    return time.perf_counter() - started, samples, errors
+
+
+async def run(args):
+    standin = StandIn(
+        Fixtures(args.fixtures),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+    )
+    runner, url = await start(standin)
+    lcapi.LEETCODE_GRAPHQL_URL = url
+    if args.rate:
+        lcapi.scheduler.rate = args.rate
+        lcapi.scheduler.burst = args.rate
+    await lcapi.init()
+
+    handles = [f"user{i}" for i in range(args.handles)]
+    try:
+        elapsed, samples, errors = await run_load(args, handles)
+    finally:
+        await lcapi.close()
+        await runner.cleanup()
+
+    report = {
+        "elapsed": round(elapsed, 3),
+        "requests": sum(len(s) for s in samples.values()),
+        "scenarios": {
+            name: {**summarize(samples[name]), "errors": errors[name]}
+            for name in sorted(samples)
+        },
+        "upstream_requests": standin.requests,
+        "injected": standin.injected,
+        "scheduler": lcapi.scheduler.stats(),
+        "cache_hit_ratio": metrics.cache_ratios(),
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark lcapi's client, caches and retries against the local LeetCode stand-in."
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--handles", type=int, default=200)
+    parser.add_argument(
+        "--scenarios",
+        type=lambda value: value.split(","),
+        default=list(SCENARIOS),
+        help=f"comma separated, from {','.join(SCENARIOS)}",
+    )
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--rate", type=float, default=None, help="override the LeetCode rate limit"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+from typing import Dict, Optional
+
+import aiohttp
+from aiohttp import web
+from graphql import OperationDefinitionNode, parse
+
+log = logging.getLogger(__name__)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "leetcode")
+UPSTREAM_URL = "https://leetcode.com/graphql/"
+# aliased batch queries are stored and answered one alias at a time, as
+# (single-handle operation, its handle argument, its result field)
+BATCH_OPERATIONS = {
+    "batchRecentAcSubmissions": (
+        "recentAcSubmissions",
+        "username",
+        "recentAcSubmissionList",
+    ),
+    "batchUserQuestionProgress": (
+        "userProfileUserQuestionProgressV2",
+        "userSlug",
+        "userProfileUserQuestionProgressV2",
+    ),
+}
+FORWARDED_HEADERS = ("User-Agent", "Referer", "Cookie", "X-Csrftoken")
+
+
+def fixture_key(variables: dict):
+    return json.dumps(variables or {}, sort_keys=True)
+
+
+class Fixtures:
+    def __init__(self, path: str = FIXTURES_DIR):
+        self.path = path
+        self.entries: Dict[str, Dict[str, dict]] = {}
+        self.fallbacks: Dict[str, int] = {}
+        self.load()
+
+    def load(self):
+        if not os.path.isdir(self.path):
+            return
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.path, name)) as f:
+                for entry in json.load(f):
+                    self.add(entry["operation"], entry["variables"], entry["data"])
+
+    def add(self, operation: str, variables: dict, data: dict):
+        self.entries.setdefault(operation, {})[fixture_key(variables)] = data
+
+    def lookup(self, operation: str, variables: dict):
+        recorded = self.entries.get(operation)
+        if not recorded:
+            return None
+
+        data = recorded.get(fixture_key(variables))
+        if data is not None:
+            return data
+
+        # unknown arguments get the recordings for that operation in turn
+        values = list(recorded.values())
+        index = self.fallbacks.get(operation, 0)
+        self.fallbacks[operation] = index + 1
+        return values[index % len(values)]
+
+    def save(self, operation: str):
+        os.makedirs(self.path, exist_ok=True)
+        entries = [
+            {"operation": operation, "variables": json.loads(key), "data": data}
+            for key, data in self.entries.get(operation, {}).items()
+        ]
+        with open(os.path.join(self.path, f"{operation}.json"), "w") as f:
+            json.dump(entries, f, indent=2)
+
+
+def split_aliases(variables: dict):
+    # batch queries pass handles as u0..uN next to shared arguments
+    shared, aliases = {}, {}
+    for key, value in variables.items():
+        if key[0] == "u" and key[1:].isdigit():
+            aliases[key] = value
+        else:
+            shared[key] = value
+    return shared, aliases
+
+
+def operation_name(query: str):
+    for definition in parse(query).definitions:
+        if isinstance(definition, OperationDefinitionNode) and definition.name:
+            return definition.name.value
+    return None
+
+
+class StandIn:
+    def __init__(
+        self,
+        fixtures: Fixtures,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: Optional[int] = None,
+        record_from: Optional[str] = None,
+    ):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rng = random.Random(seed)
+        self.record_from = record_from
+        self.upstream: Optional[aiohttp.ClientSession] = None
+        self.requests: Dict[str, int] = {}
+        self.injected: Dict[str, int] = {"error": 0, "throttle": 0, "missing": 0}
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/graphql/", self.handle)
+        app.router.add_post("/graphql", self.handle)
+        app.on_cleanup.append(self.close)
+        return app
+
+    async def close(self, app=None):
+        if self.upstream:
+            await self.upstream.close()
+        self.upstream = None
+
+    async def handle(self, request: web.Request):
+        body = await request.json()
+        operation = body.get("operationName") or operation_name(body["query"])
+        variables = body.get("variables") or {}
+        self.requests[operation] = self.requests.get(operation, 0) + 1
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(
+                max(0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            )
+
+        # leetcode answers these with an html page, not a graphql error body
+        if self.rng.random() < self.throttle_rate:
+            self.injected["throttle"] += 1
+            return web.Response(
+                text="Too Many Requests", status=429, headers={"Retry-After": "1"}
+            )
+        if self.rng.random() < self.error_rate:
+            self.injected["error"] += 1
+            return web.Response(text="Internal Server Error", status=500)
+
+        if self.record_from:
+            return await self.record(request, body, operation, variables)
+
+        data = self.replay(operation, variables)
+        if data is None:
+            self.injected["missing"] += 1
+            return web.json_response(
+                {"errors": [{"message": f"No fixture recorded for {operation}"}]},
+                status=400,
+            )
+        return web.json_response({"data": data})
+
+    def replay(self, operation: str, variables: dict):
+        if operation not in BATCH_OPERATIONS:
+            return self.fixtures.lookup(operation, variables)
+
+        single, argument, field = BATCH_OPERATIONS[operation]
+        shared, aliases = split_aliases(variables)
+        data = {}
+        for alias, handle in aliases.items():
+            recorded = self.fixtures.lookup(single, {argument: handle, **shared})
+            data[alias] = recorded[field] if recorded else None
+        return data
+
+    async def record(self, request: web.Request, body: dict, operation, variables):
+        if self.upstream is None:
+            self.upstream = aiohttp.ClientSession()
+
+        headers = {
+            name: request.headers[name]
+            for name in FORWARDED_HEADERS
+            if name in request.headers
+        }
+        async with self.upstream.post(
+            self.record_from, json=body, headers=headers
+        ) as response:
+            payload = await response.json(content_type=None)
+            status = response.status
+
+        if status == 200 and payload.get("data") and not payload.get("errors"):
+            self.save(operation, variables, payload["data"])
+        return web.json_response(payload, status=status)
+
+    def save(self, operation: str, variables: dict, data: dict):
+        if operation in BATCH_OPERATIONS:
+            single, argument, field = BATCH_OPERATIONS[operation]
+            shared, aliases = split_aliases(variables)
+            for alias, handle in aliases.items():
+                if data.get(alias) is not None:
+                    self.fixtures.add(
+                        single, {argument: handle, **shared}, {field: data[alias]}
+                    )
+            operation = single
+        else:
+            self.fixtures.add(operation, variables, data)
+
+        self.fixtures.save(operation)
+        log.info("Recorded %s", operation)
+
+
+async def start(standin: StandIn, host: str = "127.0.0.1", port: int = 0):
+    runner = web.AppRunner(standin.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    # port 0 picks a free port, report the real one
+    bound_port = runner.addresses[0][1]
+    return runner, f"http://{host}:{bound_port}/graphql/"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the LeetCode GraphQL API that replays recorded responses."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="added latency in seconds"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="+/- random latency in seconds"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="fraction of 500 responses"
+    )
+    parser.add_argument(
+        "--throttle-rate", type=float, default=0.0, help="fraction of 429 responses"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--record",
+        nargs="?",
+        const=UPSTREAM_URL,
+        default=None,
+        help="proxy to this upstream and save its responses as fixtures",
+    )
+    return parser.parse_args()
+
+
+async def serve(args):
+    standin = StandIn(
+        Fixtures(args.fixtures),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+        record_from=args.record,
+    )
+    runner, url = await start(standin, args.host, args.port)
+    print(f"Serving LeetCode stand-in on {url}")
+    print(f"Point the bot at it with LEETCODE_GRAPHQL_URL={url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(parse_args()))
@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+from collections import defaultdict
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import db
+import lcapi
+import main
+import metrics
+import problems
+import tracing
+from util import finish_command
+
+from bench.common import FakeLeetCodeSession, create_database, handle_for, summarize
+from bench.fakes import FakeInteraction, FakeUser
+
+COMMANDS = ("profile", "battle", "submit", "daily", "leaderboard", "rankup")
+DEFAULT_MIX = "profile=4,leaderboard=3,daily=3,rankup=2,battle=1,submit=1"
+
+
+class LoadTest:
+    def __init__(self, args, session: FakeLeetCodeSession):
+        self.args = args
+        self.session = session
+        self.rng = random.Random(args.seed)
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.remaining = args.requests
+        self.mix = parse_mix(args.mix)
+
+    async def invoke(self, name: str, user_id: int, **kwargs):
+        command = main.bot.tree.get_command(name)
+        interaction = FakeInteraction(
+            user_id, command, latency=self.args.discord_latency
+        )
+        started = time.perf_counter()
+        try:
+            # same path as the real dispatcher: check, callback, completion hook
+            await main.bot.tree.interaction_check(interaction)
+            await command.callback(interaction, **kwargs)
+            finish_command(interaction, "ok")
+        except Exception:
+            finish_command(interaction, "error")
+            self.errors[name] += 1
+        self.samples[name].append(time.perf_counter() - started)
+        return interaction
+
+    def random_user(self):
+        return self.rng.randint(1, self.args.users)
+
+    async def run_battle(self):
+        id_a, id_b = self.random_user(), self.random_user()
+        if (
+            id_a == id_b
+            or main.battle_registry.get(id_a)
+            or main.battle_registry.get(id_b)
+        ):
+            return await self.invoke("profile", id_a)
+
+        request = await self.invoke(
+            "battle",
+            id_a,
+            user=FakeUser(id_b),
+            difficulty=self.rng.choice(["easy", "medium", "hard"]),
+        )
+        view = request.view()
+        if view is None:
+            return
+
+        # the challenged user accepts through the view's button
+        accept = FakeInteraction(id_b, None, latency=self.args.discord_latency)
+        started = time.perf_counter()
+        try:
+            await view.accept.callback(accept)
+        except Exception:
+            self.errors["battle_accept"] += 1
+        self.samples["battle_accept"].append(time.perf_counter() - started)
+
+    async def run_submit(self):
+        active = list(main.battle_registry)
+        if not active:
+            return await self.run_battle()
+
+        battle = self.rng.choice(active)
+        winner_id = self.rng.choice(battle.key)
+        if self.rng.random() < self.args.solve_ratio:
+            self.session.solved[handle_for(winner_id)] = battle.problem_slug
+        await self.invoke("submit", winner_id)
+
+    async def run_one(self):
+        name = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        if name == "battle":
+            await self.run_battle()
+        elif name == "submit":
+            await self.run_submit()
+        else:
+            await self.invoke(name, self.random_user())
+
+    async def worker(self, deadline: float):
+        while time.monotonic() < deadline:
+            if self.remaining is not None:
+                if self.remaining <= 0:
+                    return
+                self.remaining -= 1
+            await self.run_one()
+
+    async def run(self):
+        deadline = time.monotonic() + (self.args.duration or math.inf)
+        started = time.perf_counter()
+        await asyncio.gather(
+            *[self.worker(deadline) for _ in range(self.args.concurrency)]
+        )
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float):
+        commands = {
+            name: {
+                **summarize(samples),
+                "errors": self.errors[name],
+                "throughput": round(len(samples) / elapsed, 2),
+            }
+            for name, samples in sorted(self.samples.items())
+        }
+        total = sum(len(samples) for samples in self.samples.values())
+        return {
+            "users": self.args.users,
+            "concurrency": self.args.concurrency,
+            "elapsed": round(elapsed, 3),
+            "requests": total,
+            "throughput": round(total / elapsed, 2),
+            "commands": commands,
+            "leetcode_calls": leetcode_calls(),
+            "scheduler": lcapi.scheduler.stats(),
+        }
+
+
+def leetcode_calls():
+    calls = defaultdict(int)
+    for labels, count in metrics.counters.get("lcapi_request_total", {}).items():
+        labels = dict(labels)
+        calls[f"{labels['operation']} {labels['status']}"] += count
+    return dict(calls)
+
+
+def parse_mix(mix: str):
+    weights = {}
+    for entry in mix.split(","):
+        name, _, weight = entry.partition("=")
+        if name not in COMMANDS:
+            raise argparse.ArgumentTypeError(f"Unknown command {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def print_report(report: dict):
+    print(
+        f"{report['requests']} requests in {report['elapsed']}s"
+        + f" ({report['throughput']} req/s, concurrency {report['concurrency']})"
+    )
+    print(
+        f"{'command':<14} {'n':>6} {'err':>5} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}"
+    )
+    for name, stats in report["commands"].items():
+        print(
+            f"{name:<14} {stats['count']:>6} {stats['errors']:>5} {stats['throughput']:>8}"
+            + f" {stats['p50_ms']:>7.1f}ms {stats['p95_ms']:>7.1f}ms {stats['p99_ms']:>7.1f}ms"
+        )
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="lcc-bench-")
+    path = os.path.join(workdir, "bench.db")
+    create_database(path, args.users, args.seed)
+
+    session = FakeLeetCodeSession(
+        latency=args.upstream_latency, solved_ratio=args.solve_ratio, seed=args.seed
+    )
+    if args.leetcode_url:
+        # real lcapi client against a stand-in, see bench/leetcode_server.py
+        lcapi.LEETCODE_GRAPHQL_URL = args.leetcode_url
+        await lcapi.init()
+    else:
+        lcapi.session = session
+    if args.lc_rate:
+        lcapi.scheduler.rate = args.lc_rate
+        lcapi.scheduler.burst = args.lc_rate
+    # the slow-command log would drown out the report
+    tracing.SLOW_COMMAND_THRESHOLD = math.inf
+
+    await db.init(path)
+    try:
+        await problems.load()
+        problems.fill_pools()
+        load_test = LoadTest(args, session)
+        elapsed = await load_test.run()
+        report = load_test.report(elapsed)
+    finally:
+        await lcapi.close()
+        await db.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Drive the bot's slash commands with fake interactions against a temp database."
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--requests", type=int, default=2000, help="total commands to run"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=None, help="stop after this many seconds"
+    )
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="command=weight,...")
+    parser.add_argument(
+        "--upstream-latency",
+        type=float,
+        default=0.05,
+        help="mean fake LeetCode latency in seconds",
+    )
+    parser.add_argument(
+        "--discord-latency",
+        type=float,
+        default=0.0,
+        help="fake Discord response latency in seconds",
+    )
+    parser.add_argument(
+        "--lc-rate",
+        type=float,
+        default=None,
+        help="override the LeetCode request rate limit",
+    )
+    parser.add_argument(
+        "--solve-ratio",
+        type=float,
+        default=0.5,
+        help="chance a user has solved the daily or battle problem",
+    )
+    parser.add_argument(
+        "--leetcode-url",
+        default=None,
+        help="send LeetCode queries to this GraphQL endpoint instead of the in-process fake",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -1,32 +1,412 @@
-from typing import List, Tuple
+import asyncio
+from contextlib import asynccontextmanager
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Set, Tuple
 import aiosqlite
-from cache import AsyncTTL
-
-from consts import RANK_VALUE
+from cachetools import LRUCache
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+DB_PATH = "lcc.db"
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+SCHEMA_MIGRATIONS_TABLE = """CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    applied_at INTEGER NOT NULL
+)"""
+# databases from before schema_migrations was tracked, these can't simply be
+# rerun so check whether their changes are already there
+LEGACY_MIGRATIONS = {
+    "2024-10-17": "SELECT 1 FROM pragma_table_info('users') WHERE name = 'wins'",
+    "2026-10-18-03-leaderboard-index": "SELECT 1 FROM pragma_table_xinfo('users') WHERE name = 'rank_value'",
+}
+LEADERBOARD_SIZE = 10
+USER_CACHE_SIZE = 4096
+GROUP_COMMIT_WINDOW = 0.005
+GROUP_COMMIT_MAX = 256
+# read-only connections, each with its own thread, so reads don't queue
+# behind each other or behind the writer
+READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", "4"))
+STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "256"))
+# credit is worked out against the stored counts at write time, so the sweep
+# and /sync can't both pay for the same solves
+SYNC_SOLVED_SQL = (
+    "UPDATE users SET tickets = tickets + MAX(0, ? - easies) * 5 + MAX(0, ? - mediums) * 10"
+    + " + MAX(0, ? - hards) * 25, easies = ?, mediums = ?, hards = ? WHERE discord_id = ?"
+)
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
 
 db = None
+readers: List[aiosqlite.Connection] = []
+idle_readers: Optional[asyncio.Queue] = None
+leaderboard_snapshot = None
+leaderboard_version = 0
+write_queue: Optional[asyncio.Queue] = None
+writer_task: Optional[asyncio.Task] = None
+
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE)
+# in-flight get_info loads, and the ones a write raced with
+user_loads: Dict[int, int] = {}
+stale_user_loads: Set[int] = set()
+
+
+class UserRecord:
+    __slots__ = (
+        "discord_id",
+        "leetcode_handle",
+        "rank",
+        "tickets",
+        "easies",
+        "mediums",
+        "hards",
+        "champion_lp",
+        "wins",
+        "losses",
+    )
+
+    def __init__(self, row: Tuple):
+        for name, value in zip(self.__slots__, row):
+            setattr(self, name, value)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def invalidate_users(discord_ids):
+    for discord_id in discord_ids:
+        user_cache.pop(discord_id, None)
+        if discord_id in user_loads:
+            stale_user_loads.add(discord_id)
+
+
+def get_migrations():
+    return [
+        (name[: -len(".sql")], os.path.join(MIGRATIONS_DIR, name))
+        for name in sorted(os.listdir(MIGRATIONS_DIR))
+        if name.endswith(".sql")
+    ]
+
+
+async def get_applied_migrations():
+    async with db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'"
+    ) as cursor:
+        tracked = await cursor.fetchone() is not None
+
+    await db.execute(SCHEMA_MIGRATIONS_TABLE)
+    if not tracked:
+        for version, check in LEGACY_MIGRATIONS.items():
+            async with db.execute(check) as cursor:
+                if await cursor.fetchone():
+                    await db.execute(
+                        "INSERT INTO schema_migrations (version, applied_at) VALUES (?, ?)",
+                        (version, int(time.time())),
+                    )
+        await db.commit()
+
+    async with db.execute("SELECT version FROM schema_migrations") as cursor:
+        return {row[0] for row in await cursor.fetchall()}
+
+
+async def migrate():
+    applied = await get_applied_migrations()
+    for version, path in get_migrations():
+        if version in applied:
+            continue
+
+        with open(path) as f:
+            script = f.read()
+
+        log.info("Applying migration %s", version)
+        try:
+            await db.executescript("BEGIN;\n" + script)
+            await db.execute(
+                "INSERT INTO schema_migrations (version, applied_at) VALUES (?, ?)",
+                (version, int(time.time())),
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+
+async def connect(path: str, read_only: bool = False):
+    if read_only:
+        conn = await aiosqlite.connect(
+            f"file:{path}?mode=ro", uri=True, cached_statements=STATEMENT_CACHE_SIZE
+        )
+    else:
+        conn = await aiosqlite.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        await conn.execute(pragma)
+    return conn
+
+
+async def init(path: str = DB_PATH):
+    global db, idle_readers, write_queue, writer_task
+    db = await connect(path)
+    await migrate()
+
+    # opened after migrating so they see the final schema
+    readers.clear()
+    idle_readers = asyncio.Queue()
+    for _ in range(max(1, READ_POOL_SIZE)):
+        conn = await connect(path, read_only=True)
+        readers.append(conn)
+        idle_readers.put_nowait(conn)
+
+    write_queue = asyncio.Queue()
+    writer_task = asyncio.create_task(run_writer())
+
+
+async def close():
+    await write_queue.put(None)
+    await writer_task
+    for conn in readers:
+        await conn.close()
+    readers.clear()
+    await db.close()
+
+
+@asynccontextmanager
+async def reader():
+    conn = await idle_readers.get()
+    try:
+        yield conn
+    finally:
+        idle_readers.put_nowait(conn)
+
+
+@metrics.collect()
+def collect_pool_stats():
+    if idle_readers is None:
+        return []
+    return [
+        ("db_read_pool_size", {}, len(readers)),
+        ("db_read_pool_idle", {}, idle_readers.qsize()),
+    ]
+
+
+async def apply_batch(batch: List[Tuple["Transaction", asyncio.Future]]):
+    results = []
+    try:
+        await db.execute("BEGIN")
+        for tx, future in batch:
+            # savepoints keep one bad write from sinking the whole batch
+            await db.execute("SAVEPOINT tx")
+            try:
+                for kind, sql, params in tx.statements:
+                    if kind == "executemany":
+                        await db.executemany(sql, params)
+                    elif kind == "fetch":
+                        async with db.execute(sql, params) as cursor:
+                            tx.fetched.append(await cursor.fetchall())
+                    else:
+                        await db.execute(sql, params)
+            except Exception as e:
+                tx.fetched.clear()
+                await db.execute("ROLLBACK TO tx")
+                results.append((tx, future, e))
+            else:
+                results.append((tx, future, None))
+            await db.execute("RELEASE tx")
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        results = [(tx, future, e) for tx, future in batch]
+
+    for tx, future, error in results:
+        metrics.inc(
+            "db_transactions_total",
+            query=tx.name,
+            status="ok" if error is None else "error",
+        )
+        invalidate_users(tx.users)
+        if error is None and tx.leaderboard_dirty:
+            invalidate_leaderboard()
+
+        if future.done():
+            continue
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+
+async def run_writer():
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await write_queue.get()
+        if item is None:
+            return
+
+        batch = [item]
+        stopping = False
+        deadline = loop.time() + GROUP_COMMIT_WINDOW
+        while len(batch) < GROUP_COMMIT_MAX:
+            timeout = deadline - loop.time()
+            if timeout <= 0 and write_queue.empty():
+                break
+
+            try:
+                item = await asyncio.wait_for(write_queue.get(), max(0, timeout))
+            except asyncio.TimeoutError:
+                break
+
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+
+        with metrics.measure("db_write_batch"):
+            await apply_batch(batch)
+        if stopping:
+            return
+
+
+class Transaction:
+    def __init__(self, name: str):
+        # labels this write in the db_commit and db_transactions metrics
+        self.name = name
+        self.statements = []
+        # rows read by fetch(), in order, once the transaction has committed
+        self.fetched = []
+        self.users = set()
+        self.leaderboard_dirty = False
+
+    def touch(self, discord_id: int):
+        self.users.add(discord_id)
+
+    def execute(self, sql: str, params: Tuple = ()):
+        self.statements.append(("execute", sql, params))
+
+    def executemany(self, sql: str, params: List[Tuple]):
+        self.statements.append(("executemany", sql, params))
+
+    def fetch(self, sql: str, params: Tuple = ()):
+        self.statements.append(("fetch", sql, params))
+
+    def set_rank(self, discord_id: int, rank: str):
+        self.touch(discord_id)
+        self.execute(
+            "UPDATE users SET rank = ? WHERE discord_id = ?", (rank, discord_id)
+        )
+        self.leaderboard_dirty = True
+
+    def set_lp(self, discord_id: int, lp: int):
+        self.touch(discord_id)
+        self.execute(
+            "UPDATE users SET champion_lp = ? WHERE discord_id = ?", (lp, discord_id)
+        )
+        self.leaderboard_dirty = True
 
+    def add_lp(self, discord_id: int, lp: int):
+        self.touch(discord_id)
+        self.execute(
+            "UPDATE users SET champion_lp = MAX(0, champion_lp + ?) WHERE discord_id = ?",
+            (lp, discord_id),
+        )
+        self.leaderboard_dirty = True
+
+    def set_tickets(self, discord_id: int, tickets: int):
+        self.touch(discord_id)
+        self.execute(
+            "UPDATE users SET tickets = ? WHERE discord_id = ?", (tickets, discord_id)
+        )
+        self.leaderboard_dirty = True
+
+    def add_tickets(self, discord_id: int, tickets: int):
+        self.touch(discord_id)
+        self.execute(
+            "UPDATE users SET tickets = tickets + ? WHERE discord_id = ?",
+            (tickets, discord_id),
+        )
+        self.leaderboard_dirty = True
+
+    def sync_solved(self, discord_id: int, lc_info: dict):
+        self.touch(discord_id)
+        counts = (lc_info["EASY"], lc_info["MEDIUM"], lc_info["HARD"])
+        self.execute(SYNC_SOLVED_SQL, counts + counts + (discord_id,))
+        self.leaderboard_dirty = True
+
+    def claim_daily(self, discord_id: int, start_time: int):
+        self.execute(
+            "INSERT INTO daily_claims (discord_id, daily_start_time) VALUES (?, ?)",
+            (discord_id, start_time),
+        )
+        # a claim for the day after the last one extends the streak
+        self.execute(
+            "INSERT INTO daily_streaks (discord_id, last_claimed, current_streak, best_streak, total_claims)"
+            + " VALUES (?, ?, 1, 1, 1) ON CONFLICT (discord_id) DO UPDATE SET"
+            + " current_streak = CASE WHEN excluded.last_claimed = last_claimed + 86400 THEN current_streak + 1"
+            + " WHEN excluded.last_claimed > last_claimed THEN 1 ELSE current_streak END,"
+            + " best_streak = MAX(best_streak, CASE WHEN excluded.last_claimed = last_claimed + 86400 THEN current_streak + 1 ELSE 1 END),"
+            + " last_claimed = MAX(last_claimed, excluded.last_claimed),"
+            + " total_claims = total_claims + 1",
+            (discord_id, start_time),
+        )
+
+    def add_wins(self, discord_id: int, wins: int = 1):
+        self.touch(discord_id)
+        self.execute(
+            "UPDATE users SET wins = wins + ? WHERE discord_id = ?", (wins, discord_id)
+        )
+
+    def add_losses(self, discord_id: int, losses: int = 1):
+        self.touch(discord_id)
+        self.execute(
+            "UPDATE users SET losses = losses + ? WHERE discord_id = ?",
+            (losses, discord_id),
+        )
+
+    async def commit(self):
+        with metrics.measure("db_commit", query=self.name):
+            await self.submit()
+
+    def submit(self):
+        future = asyncio.get_running_loop().create_future()
+        if not self.statements:
+            future.set_result(None)
+            return future
+
+        invalidate_users(self.users)
+        write_queue.put_nowait((self, future))
+        return future
 
-async def init():
-    global db
-    db = await aiosqlite.connect("lcc.db")
+
+@asynccontextmanager
+async def transaction(name: str):
+    tx = Transaction(name)
+    yield tx
+    await tx.commit()
 
 
 async def link_id(discord_id: int, leetcode_handle: str, lc_info: dict):
-    await db.execute(
-        "INSERT INTO users (discord_id, leetcode_handle, rank, tickets, easies, mediums, hards, champion_lp, wins, losses)"
-        + " VALUES (?, ?, 'Noob', 0, ?, ?, ?, 0, 0, 0) ON CONFLICT (discord_id) DO UPDATE"
-        + " SET leetcode_handle = ?, rank = 'Noob', tickets = 0, easies = 0, mediums = 0, hards = 0, champion_lp = 0, wins = 0, losses = 0 WHERE discord_id = excluded.discord_id",
-        (
-            discord_id,
-            leetcode_handle,
-            lc_info["EASY"],
-            lc_info["MEDIUM"],
-            lc_info["HARD"],
-            leetcode_handle,
-        ),
-    )
-    await db.commit()
+    async with transaction("link_id") as tx:
+        tx.execute(
+            "INSERT INTO users (discord_id, leetcode_handle, rank, tickets, easies, mediums, hards, champion_lp, wins, losses)"
+            + " VALUES (?, ?, 'Noob', 0, ?, ?, ?, 0, 0, 0) ON CONFLICT (discord_id) DO UPDATE"
+            + " SET leetcode_handle = ?, rank = 'Noob', tickets = 0, easies = 0, mediums = 0, hards = 0, champion_lp = 0, wins = 0, losses = 0 WHERE discord_id = excluded.discord_id",
+            (
+                discord_id,
+                leetcode_handle,
+                lc_info["EASY"],
+                lc_info["MEDIUM"],
+                lc_info["HARD"],
+                leetcode_handle,
+            ),
+        )
+        tx.touch(discord_id)
+        tx.leaderboard_dirty = True
     return {
         "discord_id": discord_id,
         "leetcode_handle": leetcode_handle,
@@ -38,125 +418,393 @@ async def link_id(discord_id: int, leetcode_handle: str, lc_info: dict):
 
 
 async def get_leetcode_handle(discord_id: int):
-    async with db.execute(
-        "SELECT leetcode_handle FROM users WHERE discord_id = ?", (discord_id,)
+    info = await get_info(discord_id)
+    if not info:
+        return None
+
+    return info["leetcode_handle"]
+
+
+@metrics.timed("db_query", query="load_user")
+async def load_user(discord_id: int):
+    async with reader() as conn, conn.execute(
+        "SELECT discord_id, leetcode_handle, rank, tickets, easies, mediums, hards, champion_lp, wins, losses"
+        + " FROM users WHERE discord_id = ?",
+        (discord_id,),
     ) as cursor:
         row = await cursor.fetchone()
 
     if not row:
         return None
 
-    return row[0]
+    return UserRecord(row)
 
 
 async def get_info(discord_id: int):
-    async with db.execute(
-        "SELECT * FROM users WHERE discord_id = ?", (discord_id,)
-    ) as cursor:
-        row = await cursor.fetchone()
-
-    if not row:
+    record = user_cache.get(discord_id)
+    metrics.cache_lookup("user", record is not None)
+    if record:
+        return record.to_dict()
+
+    user_loads[discord_id] = user_loads.get(discord_id, 0) + 1
+    try:
+        record = await load_user(discord_id)
+    finally:
+        user_loads[discord_id] -= 1
+        stale = discord_id in stale_user_loads
+        if not user_loads[discord_id]:
+            del user_loads[discord_id]
+            stale_user_loads.discard(discord_id)
+
+    if not record:
         return None
 
-    return {
-        "discord_id": row[0],
-        "leetcode_handle": row[1],
-        "rank": row[2],
-        "tickets": row[3],
-        "easies": row[4],
-        "mediums": row[5],
-        "hards": row[6],
-        "champion_lp": row[7],
-        "wins": row[8],
-        "losses": row[9],
-    }
+    if not stale:
+        user_cache[discord_id] = record
+    return record.to_dict()
 
 
 async def set_rank(discord_id: int, rank: str):
-    await db.execute(
-        "UPDATE users SET rank = ? WHERE discord_id = ?", (rank, discord_id)
-    )
-    await db.commit()
+    async with transaction("set_rank") as tx:
+        tx.set_rank(discord_id, rank)
 
 
 async def set_lp(discord_id: int, lp: int):
-    await db.execute(
-        "UPDATE users SET champion_lp = ? WHERE discord_id = ?", (lp, discord_id)
-    )
-    await db.commit()
+    async with transaction("set_lp") as tx:
+        tx.set_lp(discord_id, lp)
+
+
+async def add_lp(discord_id: int, lp: int):
+    async with transaction("add_lp") as tx:
+        tx.add_lp(discord_id, lp)
 
 
 async def set_tickets(discord_id: int, tickets: int):
-    await db.execute(
-        f"UPDATE users SET tickets = {tickets} WHERE discord_id = ?",
-        (discord_id,),
-    )
-    await db.commit()
+    async with transaction("set_tickets") as tx:
+        tx.set_tickets(discord_id, tickets)
+
+
+async def add_tickets(discord_id: int, tickets: int):
+    async with transaction("add_tickets") as tx:
+        tx.add_tickets(discord_id, tickets)
 
 
 async def sync_solved(discord_id: int, lc_info: dict):
-    await db.execute(
-        "UPDATE users SET easies = ?, mediums = ?, hards = ? WHERE discord_id = ?",
-        (lc_info["EASY"], lc_info["MEDIUM"], lc_info["HARD"], discord_id),
-    )
-    await db.commit()
+    async with transaction("sync_solved") as tx:
+        # counts as they were right before the update, so /sync reports what
+        # was actually credited rather than what it read earlier
+        tx.fetch(
+            "SELECT easies, mediums, hards FROM users WHERE discord_id = ?",
+            (discord_id,),
+        )
+        tx.sync_solved(discord_id, lc_info)
 
+    rows = tx.fetched[0]
+    if not rows:
+        return None
 
-async def check_daily_claimed(discord_id: int, start_time: int):
-    async with db.execute(
-        "SELECT discord_id FROM daily_claims WHERE discord_id = ? AND daily_start_time = ? LIMIT 1",
-        (discord_id, start_time),
+    easies, mediums, hards = rows[0]
+    return {"easies": easies, "mediums": mediums, "hards": hards}
+
+
+@metrics.timed("db_query", query="get_daily_streak")
+async def get_daily_streak(discord_id: int):
+    async with reader() as conn, conn.execute(
+        "SELECT last_claimed, current_streak, best_streak, total_claims FROM daily_streaks WHERE discord_id = ?",
+        (discord_id,),
     ) as cursor:
         row = await cursor.fetchone()
 
-    if row:
+    if not row:
+        return None
+
+    return {
+        "last_claimed": row[0],
+        "current_streak": row[1],
+        "best_streak": row[2],
+        "total_claims": row[3],
+    }
+
+
+@metrics.timed("db_query", query="find_daily_claim")
+async def find_daily_claim(discord_id: int, start_time: int):
+    async with reader() as conn, conn.execute(
+        "SELECT 1 FROM daily_claims WHERE discord_id = ? AND daily_start_time = ?"
+        + " UNION ALL SELECT 1 FROM daily_claims_archive WHERE discord_id = ? AND daily_start_time = ?",
+        (discord_id, start_time, discord_id, start_time),
+    ) as cursor:
+        return await cursor.fetchone() is not None
+
+
+async def check_daily_claimed(discord_id: int, start_time: int):
+    streak = await get_daily_streak(discord_id)
+    if not streak or streak["last_claimed"] < start_time:
+        return False
+    if streak["last_claimed"] == start_time:
         return True
 
-    return False
+    # only older days need the raw history
+    return await find_daily_claim(discord_id, start_time)
 
 
 async def set_daily_claimed(discord_id: int, start_time: int):
-    await db.execute("INSERT INTO daily_claims VALUES (?, ?)", (discord_id, start_time))
-    await db.commit()
+    return await claim_daily(discord_id, start_time, 0)
+
+
+async def claim_daily(discord_id: int, start_time: int, tickets: int):
+    try:
+        async with transaction("claim_daily") as tx:
+            tx.claim_daily(discord_id, start_time)
+            if tickets:
+                tx.add_tickets(discord_id, tickets)
+    except aiosqlite.IntegrityError:
+        # a concurrent /daily already claimed it, no double tickets
+        return False
+    return True
+
+
+async def compact_daily_claims(cutoff: int, batch_size: int):
+    async with db.execute(
+        "SELECT COUNT(*) FROM daily_claims WHERE daily_start_time < ?", (cutoff,)
+    ) as cursor:
+        (total,) = await cursor.fetchone()
+
+    # small batches so /daily claims don't queue behind one huge write
+    selected = "SELECT rowid FROM daily_claims WHERE daily_start_time < ? ORDER BY rowid LIMIT ?"
+    for _ in range(0, total, batch_size):
+        async with transaction("compact_daily_claims") as tx:
+            tx.execute(
+                "INSERT OR IGNORE INTO daily_claims_archive (discord_id, daily_start_time)"
+                + f" SELECT discord_id, daily_start_time FROM daily_claims WHERE rowid IN ({selected})",
+                (cutoff, batch_size),
+            )
+            tx.execute(
+                f"DELETE FROM daily_claims WHERE rowid IN ({selected})",
+                (cutoff, batch_size),
+            )
+    return total
 
 
 async def set_wins(discord_id: int, wins: int):
-    await db.execute(
-        "UPDATE users SET wins = ? WHERE discord_id = ?", (wins, discord_id)
-    )
-    await db.commit()
+    async with transaction("set_wins") as tx:
+        tx.execute(
+            "UPDATE users SET wins = ? WHERE discord_id = ?", (wins, discord_id)
+        )
+        tx.touch(discord_id)
+
 
 async def set_losses(discord_id: int, losses: int):
-    await db.execute(
-        "UPDATE users SET losses = ? WHERE discord_id = ?", (losses, discord_id)
-    )
-    await db.commit()
+    async with transaction("set_losses") as tx:
+        tx.execute(
+            "UPDATE users SET losses = ? WHERE discord_id = ?", (losses, discord_id)
+        )
+        tx.touch(discord_id)
 
 
-@AsyncTTL(time_to_live=300, maxsize=1024)
-async def get_leaderboard(discord_id: int):
-    async with db.execute(
-        "SELECT rank, champion_lp, tickets, discord_id FROM users"
-    ) as cursor:
-        rows: List[Tuple] = await cursor.fetchall()
+@metrics.timed("db_query", query="load_leaderboard")
+async def load_leaderboard():
+    async with reader() as conn:
+        async with conn.execute(
+            "SELECT rank, champion_lp, discord_id FROM users"
+            + " ORDER BY rank_value DESC, champion_lp DESC, tickets DESC LIMIT ?",
+            (LEADERBOARD_SIZE,),
+        ) as cursor:
+            rows: List[Tuple] = await cursor.fetchall()
 
-    if not rows:
-        return []
+        async with conn.execute("SELECT COUNT(*) FROM users") as cursor:
+            (total_users,) = await cursor.fetchone()
+
+    return rows, total_users
 
-    rows.sort(key=lambda x: (RANK_VALUE[x[0]], x[1], x[2]), reverse=True)
 
-    formatted_rows = []
-    user_rank = None
-    for i, row in enumerate(rows):
-        formatted_rows.append(
+async def get_leaderboard_snapshot():
+    global leaderboard_snapshot
+    metrics.cache_lookup("leaderboard", leaderboard_snapshot is not None)
+    if leaderboard_snapshot is not None:
+        return leaderboard_snapshot
+
+    version = leaderboard_version
+    rows, total_users = await load_leaderboard()
+
+    snapshot = (
+        [
             {
                 "rank": row[0],
                 "champion_lp": row[1],
-                "discord_id": row[3],
+                "discord_id": row[2],
                 "leaderboard_rank": i + 1,
             }
+            for i, row in enumerate(rows)
+        ],
+        total_users,
+    )
+    # a write landed mid-read, don't keep the stale result around
+    if version == leaderboard_version:
+        leaderboard_snapshot = snapshot
+    return snapshot
+
+
+def invalidate_leaderboard():
+    global leaderboard_snapshot, leaderboard_version
+    leaderboard_snapshot = None
+    leaderboard_version += 1
+
+
+@metrics.timed("db_query", query="get_leaderboard_rank")
+async def get_leaderboard_rank(discord_id: int):
+    async with reader() as conn:
+        async with conn.execute(
+            "SELECT rank_value, champion_lp, tickets FROM users WHERE discord_id = ?",
+            (discord_id,),
+        ) as cursor:
+            row = await cursor.fetchone()
+
+        if not row:
+            return None
+
+        async with conn.execute(
+            "SELECT COUNT(*) FROM users WHERE (rank_value, champion_lp, tickets) > (?, ?, ?)",
+            row,
+        ) as cursor:
+            (ahead,) = await cursor.fetchone()
+
+    return ahead + 1
+
+
+async def get_leaderboard(discord_id: int):
+    top_rows, total_users = await get_leaderboard_snapshot()
+    if not total_users:
+        return []
+
+    return top_rows, await get_leaderboard_rank(discord_id), total_users
+
+
+@metrics.timed("db_query", query="get_problems")
+async def get_problems():
+    async with db.execute(
+        "SELECT title_slug, title, difficulty, ac_rate, paid_only, fetched_at FROM problems"
+    ) as cursor:
+        rows = await cursor.fetchall()
+
+    return [
+        {
+            "titleSlug": row[0],
+            "title": row[1],
+            "difficulty": row[2],
+            "acRate": row[3],
+            "paidOnly": bool(row[4]),
+            "fetchedAt": row[5],
+        }
+        for row in rows
+    ]
+
+
+async def replace_problems(problems: List[dict], fetched_at: int):
+    async with transaction("replace_problems") as tx:
+        tx.execute("DELETE FROM problems")
+        tx.executemany(
+            "INSERT INTO problems (title_slug, title, difficulty, ac_rate, paid_only, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    problem["titleSlug"],
+                    problem["title"],
+                    problem["difficulty"],
+                    problem["acRate"],
+                    problem["paidOnly"],
+                    fetched_at,
+                )
+                for problem in problems
+            ],
         )
-        if row[3] == discord_id:
-            user_rank = i + 1
 
-    return formatted_rows[:10], user_rank, len(rows)
+
+@metrics.timed("db_query", query="get_users_page")
+async def get_users_page(after_id: int, limit: int):
+    async with db.execute(
+        "SELECT discord_id, leetcode_handle, easies, mediums, hards FROM users"
+        + " WHERE discord_id > ? ORDER BY discord_id LIMIT ?",
+        (after_id, limit),
+    ) as cursor:
+        rows = await cursor.fetchall()
+
+    return [
+        {
+            "discord_id": row[0],
+            "leetcode_handle": row[1],
+            "easies": row[2],
+            "mediums": row[3],
+            "hards": row[4],
+        }
+        for row in rows
+    ]
+
+
+@metrics.timed("db_query", query="get_job_cursor")
+async def get_job_cursor(name: str):
+    async with db.execute(
+        "SELECT value FROM job_state WHERE name = ?", (name,)
+    ) as cursor:
+        row = await cursor.fetchone()
+
+    if not row:
+        return None
+
+    return row[0]
+
+
+async def set_job_state(name: str, value: str):
+    async with transaction("set_job_state") as tx:
+        tx.execute(
+            "INSERT INTO job_state (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            (name, value),
+        )
+
+
+async def sync_solved_many(updates: List[Tuple], job_name: str, job_cursor: str):
+    # updates are (discord_id, lc_info)
+    async with transaction("sync_solved_many") as tx:
+        if updates:
+            tx.executemany(
+                SYNC_SOLVED_SQL,
+                [
+                    (lc_info["EASY"], lc_info["MEDIUM"], lc_info["HARD"]) * 2
+                    + (discord_id,)
+                    for discord_id, lc_info in updates
+                ],
+            )
+            for discord_id, _ in updates:
+                tx.touch(discord_id)
+            tx.leaderboard_dirty = True
+        tx.execute(
+            "INSERT INTO job_state (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            (job_name, job_cursor),
+        )
+
+
+@metrics.timed("db_query", query="load_state")
+async def load_state(now: float):
+    async with db.execute(
+        "SELECT kind, key, value, expires_at FROM state WHERE expires_at > ?", (now,)
+    ) as cursor:
+        return await cursor.fetchall()
+
+
+def put_state(kind: str, key: str, value: str, expires_at: float):
+    tx = Transaction("put_state")
+    tx.execute(
+        "INSERT INTO state (kind, key, value, expires_at) VALUES (?, ?, ?, ?)"
+        + " ON CONFLICT (kind, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+        (kind, key, value, expires_at),
+    )
+    return tx.submit()
+
+
+def delete_state(kind: str, key: str):
+    tx = Transaction("delete_state")
+    tx.execute("DELETE FROM state WHERE kind = ? AND key = ?", (kind, key))
+    return tx.submit()
+
+
+async def purge_state(now: float):
+    async with transaction("purge_state") as tx:
+        tx.execute("DELETE FROM state WHERE expires_at <= ?", (now,))
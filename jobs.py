@@ -0,0 +1,133 @@
+from datetime import datetime, time, timezone
+import logging
+from discord.ext import tasks
+
+import battles
+import db
+import lcapi
+import problems
+from scheduler import PRIORITY_BACKGROUND
+import state
+
+log = logging.getLogger(__name__)
+
+SOLVE_COUNT_SYNC_JOB = "solve_count_sync"
+SOLVE_COUNT_SYNC_CONCURRENCY = 4
+# raw daily_claims rows older than this move to daily_claims_archive
+DAILY_CLAIM_RETENTION_DAYS = 90
+DAILY_CLAIM_COMPACTION_BATCH = 5000
+
+
+@tasks.loop(hours=1)
+async def refresh_problem_catalog():
+    if not problems.is_stale():
+        return
+
+    try:
+        await problems.refresh()
+    except Exception:
+        log.exception("Failed to refresh problem catalog")
+
+
+@refresh_problem_catalog.before_loop
+async def load_problem_catalog():
+    await problems.load()
+    problems.fill_pools()
+
+
+@tasks.loop(time=time(hour=0, minute=0, second=5, tzinfo=timezone.utc))
+async def prewarm_daily_question():
+    try:
+        await lcapi.get_daily_question()
+    except Exception:
+        log.exception("Failed to prewarm daily question")
+
+
+async def sync_solve_count_page(after_id: int):
+    users = await db.get_users_page(
+        after_id, SOLVE_COUNT_SYNC_CONCURRENCY * lcapi.BATCH_SIZE
+    )
+    if not users:
+        # sweep finished, start from the top next time
+        await db.sync_solved_many([], SOLVE_COUNT_SYNC_JOB, "0")
+        return None
+
+    solve_counts = await lcapi.get_solve_counts(
+        [user["leetcode_handle"] for user in users], priority=PRIORITY_BACKGROUND
+    )
+
+    updates = []
+    for user in users:
+        lc_info = solve_counts.get(user["leetcode_handle"])
+        if not lc_info:
+            continue
+
+        if (lc_info["EASY"], lc_info["MEDIUM"], lc_info["HARD"]) == (
+            user["easies"],
+            user["mediums"],
+            user["hards"],
+        ):
+            continue
+
+        updates.append((user["discord_id"], lc_info))
+
+    last_id = users[-1]["discord_id"]
+    await db.sync_solved_many(updates, SOLVE_COUNT_SYNC_JOB, str(last_id))
+    return last_id
+
+
+@tasks.loop(minutes=30)
+async def sync_solve_counts():
+    try:
+        after_id = int(await db.get_job_cursor(SOLVE_COUNT_SYNC_JOB) or 0)
+        while after_id is not None:
+            after_id = await sync_solve_count_page(after_id)
+    except Exception:
+        log.exception("Failed to sync solve counts")
+
+
+@tasks.loop(minutes=10)
+async def purge_expired_state():
+    try:
+        await state.purge()
+    except Exception:
+        log.exception("Failed to purge expired state")
+
+
+@tasks.loop(time=time(hour=0, minute=30, tzinfo=timezone.utc))
+async def compact_daily_claims():
+    cutoff = (int(datetime.now(timezone.utc).timestamp()) // 86400) * 86400
+    cutoff -= DAILY_CLAIM_RETENTION_DAYS * 86400
+    try:
+        archived = await db.compact_daily_claims(cutoff, DAILY_CLAIM_COMPACTION_BATCH)
+        if archived:
+            log.info("Archived %d daily claims", archived)
+    except Exception:
+        log.exception("Failed to compact daily claims")
+
+
+@tasks.loop(seconds=battles.registry.wheel.resolution)
+async def expire_battles():
+    await battles.registry.tick()
+
+
+@tasks.loop(seconds=5)
+async def resolve_battles():
+    try:
+        await battles.registry.poll()
+    except Exception:
+        log.exception("Failed to poll active battles")
+
+
+def start():
+    for job in (
+        expire_battles,
+        resolve_battles,
+        refresh_problem_catalog,
+        prewarm_daily_question,
+        sync_solve_counts,
+        purge_expired_state,
+        compact_daily_claims,
+    ):
+        if not job.is_running():
+            job.start()
@@ -1,13 +1,115 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import os
 import random
+from typing import Dict, List, Optional
+import aiohttp
+from cachetools import LRUCache, TTLCache
 from gql import Client
 from gql import gql
+from gql.client import AsyncClientSession
 from gql.transport.aiohttp import AIOHTTPTransport
+from gql.transport.exceptions import TransportQueryError
 
-transport = AIOHTTPTransport(url="https://leetcode.com/graphql/")
-client = Client(transport=transport)
+import metrics
+from scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_SYNC,
+    Scheduler,
+)
 
+LEETCODE_GRAPHQL_URL = os.environ.get(
+    "LEETCODE_GRAPHQL_URL", "https://leetcode.com/graphql/"
+)
+POOL_LIMIT = 32
+POOL_LIMIT_PER_HOST = 16
+KEEPALIVE_TIMEOUT = 60
+DNS_CACHE_TTL = 300
+DEFAULT_TIMEOUT = 10
+BACKGROUND_TIMEOUT = 30
+RATE_LIMIT = 5
+RATE_BURST = 10
+MAX_IN_FLIGHT = 8
+MAX_RETRIES = 3
+BATCH_SIZE = 20
+RECENT_AC_LIMIT = 15
+RECENT_AC_TTL = 5
+RECENT_AC_HISTORY = 50
+RECENT_AC_HANDLES = 4096
 
-async def get_profile_summary(handle: str):
+client: Optional[Client] = None
+session: Optional[AsyncClientSession] = None
+scheduler = Scheduler(
+    rate=RATE_LIMIT,
+    burst=RATE_BURST,
+    max_in_flight=MAX_IN_FLIGHT,
+    max_retries=MAX_RETRIES,
+)
+
+# retry interval while leetcode still serves yesterday's daily after rollover
+DAILY_STALE_TTL = 60
+
+daily_cache = {"date": None, "question": None, "expires_at": None}
+daily_fetch: Optional[asyncio.Task] = None
+
+recent_ac_cache = TTLCache(maxsize=RECENT_AC_HANDLES, ttl=RECENT_AC_TTL)
+# merged submissions per handle, so checks aren't limited to the last 15
+recent_ac_history = LRUCache(maxsize=RECENT_AC_HANDLES)
+recent_ac_fetches: Dict[str, asyncio.Task] = {}
+
+
+async def init():
+    global client, session
+    connector = aiohttp.TCPConnector(
+        limit=POOL_LIMIT,
+        limit_per_host=POOL_LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+    )
+    transport = AIOHTTPTransport(
+        url=LEETCODE_GRAPHQL_URL,
+        timeout=DEFAULT_TIMEOUT,
+        client_session_args={"connector": connector},
+    )
+    client = Client(transport=transport, execute_timeout=None)
+    session = await client.connect_async(reconnecting=False)
+
+
+async def close():
+    global client, session
+    if client:
+        await client.close_async()
+    client = None
+    session = None
+
+
+async def execute(
+    query,
+    variables: Optional[dict] = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    priority: int = PRIORITY_INTERACTIVE,
+):
+    operation = query.definitions[0].name.value
+    with metrics.measure("lcapi_request", operation=operation):
+        return await scheduler.run(
+            session.execute,
+            query,
+            variables,
+            extra_args={"timeout": aiohttp.ClientTimeout(total=timeout)},
+            priority=priority,
+        )
+
+
+@metrics.collect()
+def collect_scheduler_stats():
+    return [
+        (f"lcapi_scheduler_{stat}", {}, value)
+        for stat, value in scheduler.stats().items()
+    ]
+
+
+async def get_profile_summary(handle: str, priority: int = PRIORITY_INTERACTIVE):
     query = gql(
         """query userPublicProfile($username: String!) {
   matchedUser(username: $username) {
@@ -17,11 +119,11 @@ async def get_profile_summary(handle: str):
   }
 }"""
     )
-    result = await client.execute_async(query, {"username": handle})
+    result = await execute(query, {"username": handle}, priority=priority)
     return result.get("matchedUser", {}).get("profile", {}).get("aboutMe")
 
 
-async def get_solve_count(handle: str):
+async def get_solve_count(handle: str, priority: int = PRIORITY_SYNC):
     query = gql(
         """query userProfileUserQuestionProgressV2($userSlug: String!) {
   userProfileUserQuestionProgressV2(userSlug: $userSlug) {
@@ -32,15 +134,60 @@ async def get_solve_count(handle: str):
   }
 }"""
     )
-    result = await client.execute_async(query, {"userSlug": handle})
+    result = await execute(query, {"userSlug": handle}, priority=priority)
 
+    return parse_solve_count(result["userProfileUserQuestionProgressV2"])
+
+
+def parse_solve_count(progress: dict):
     return {
         entry["difficulty"]: entry["count"]
-        for entry in result["userProfileUserQuestionProgressV2"]["numAcceptedQuestions"]
+        for entry in progress["numAcceptedQuestions"]
     }
 
 
-async def get_daily_question():
+async def execute_batch(
+    build_query, handles: List[str], chunk_size: int, priority: int, **variables
+):
+    async def run_chunk(chunk: List[str]):
+        aliases = {f"u{i}": handle for i, handle in enumerate(chunk)}
+        query = gql(build_query(list(aliases)))
+        try:
+            data = await execute(query, {**aliases, **variables}, priority=priority)
+        except TransportQueryError as e:
+            # one bad handle shouldn't fail the rest of the batch
+            data = e.data or {}
+        return {handle: data.get(alias) for alias, handle in aliases.items()}
+
+    results = await asyncio.gather(
+        *[
+            run_chunk(handles[i : i + chunk_size])
+            for i in range(0, len(handles), chunk_size)
+        ]
+    )
+    return {handle: value for chunk in results for handle, value in chunk.items()}
+
+
+async def get_solve_counts(
+    handles: List[str], chunk_size: int = BATCH_SIZE, priority: int = PRIORITY_SYNC
+) -> Dict[str, Optional[dict]]:
+    def build_query(aliases: List[str]):
+        params = ", ".join(f"${alias}: String!" for alias in aliases)
+        fields = "\n".join(
+            f"  {alias}: userProfileUserQuestionProgressV2(userSlug: ${alias}) {{\n"
+            + "    numAcceptedQuestions {\n      count\n      difficulty\n    }\n  }"
+            for alias in aliases
+        )
+        return f"query batchUserQuestionProgress({params}) {{\n{fields}\n}}"
+
+    results = await execute_batch(build_query, handles, chunk_size, priority)
+    return {
+        handle: parse_solve_count(progress) if progress else None
+        for handle, progress in results.items()
+    }
+
+
+async def fetch_daily_question():
     query = gql(
         """
     query questionOfToday {
@@ -56,11 +203,50 @@ async def get_daily_question():
 }
     """
     )
-    result = await client.execute_async(query)
+    result = await execute(query)
     return result.get("activeDailyCodingChallengeQuestion")
 
 
-async def get_recent_ac(handle: str):
+async def refresh_daily_question():
+    global daily_fetch
+    try:
+        question = await fetch_daily_question()
+    finally:
+        daily_fetch = None
+
+    now = datetime.now(timezone.utc)
+    today = now.strftime("%Y-%m-%d")
+    if question and question["date"] == today:
+        expires_at = datetime.combine(
+            now.date() + timedelta(days=1), datetime.min.time(), timezone.utc
+        )
+    else:
+        expires_at = now + timedelta(seconds=DAILY_STALE_TTL)
+
+    daily_cache["date"] = question["date"] if question else None
+    daily_cache["question"] = question
+    daily_cache["expires_at"] = expires_at
+    return question
+
+
+async def get_daily_question():
+    global daily_fetch
+    if (
+        daily_cache["question"]
+        and datetime.now(timezone.utc) < daily_cache["expires_at"]
+    ):
+        metrics.cache_lookup("daily_question", True)
+        return daily_cache["question"]
+
+    metrics.cache_lookup("daily_question", False)
+
+    # concurrent callers share a single in-flight request
+    if daily_fetch is None:
+        daily_fetch = asyncio.create_task(refresh_daily_question())
+    return await asyncio.shield(daily_fetch)
+
+
+async def fetch_recent_ac(handle: str, priority: int = PRIORITY_INTERACTIVE):
     query = gql(
         """
     query recentAcSubmissions($username: String!, $limit: Int!) {
@@ -74,10 +260,129 @@ async def get_recent_ac(handle: str):
     """
     )
 
-    result = await client.execute_async(query, {"username": handle, "limit": 15})
+    result = await execute(
+        query, {"username": handle, "limit": RECENT_AC_LIMIT}, priority=priority
+    )
     return result.get("recentAcSubmissionList", {})
 
 
+def merge_recent_ac(handle: str, submissions: list):
+    # the newest kept submission is the watermark, so the two can't be evicted apart
+    history = recent_ac_history.get(handle, [])
+    watermark = int(history[0]["id"]) if history else 0
+    new_submissions = [
+        submission for submission in submissions if int(submission["id"]) > watermark
+    ]
+
+    if new_submissions:
+        history = sorted(
+            new_submissions, key=lambda submission: int(submission["id"]), reverse=True
+        ) + history
+        history = history[:RECENT_AC_HISTORY]
+    recent_ac_history[handle] = history
+    recent_ac_cache[handle] = history
+    return history
+
+
+async def refresh_recent_ac(handle: str, priority: int):
+    try:
+        submissions = await fetch_recent_ac(handle, priority=priority)
+    finally:
+        recent_ac_fetches.pop(handle, None)
+    return merge_recent_ac(handle, submissions)
+
+
+async def get_recent_ac(handle: str, priority: int = PRIORITY_INTERACTIVE):
+    cached = recent_ac_cache.get(handle)
+    metrics.cache_lookup("recent_ac", cached is not None)
+    if cached is not None:
+        return cached
+
+    # concurrent checks for the same handle share one request
+    fetch = recent_ac_fetches.get(handle)
+    if fetch is None:
+        fetch = asyncio.create_task(refresh_recent_ac(handle, priority))
+        recent_ac_fetches[handle] = fetch
+    return await asyncio.shield(fetch)
+
+
+async def get_recent_acs(
+    handles: List[str],
+    chunk_size: int = BATCH_SIZE,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> Dict[str, Optional[list]]:
+    def build_query(aliases: List[str]):
+        params = ", ".join(f"${alias}: String!" for alias in aliases)
+        fields = "\n".join(
+            f"  {alias}: recentAcSubmissionList(username: ${alias}, limit: $limit) {{\n"
+            + "    id\n    title\n    titleSlug\n    timestamp\n  }"
+            for alias in aliases
+        )
+        return (
+            f"query batchRecentAcSubmissions({params}, $limit: Int!) {{\n{fields}\n}}"
+        )
+
+    results = {}
+    missing = []
+    for handle in handles:
+        cached = recent_ac_cache.get(handle)
+        metrics.cache_lookup("recent_ac", cached is not None)
+        if cached is not None:
+            results[handle] = cached
+        else:
+            missing.append(handle)
+
+    if missing:
+        fetched = await execute_batch(
+            build_query, missing, chunk_size, priority, limit=RECENT_AC_LIMIT
+        )
+        for handle, submissions in fetched.items():
+            results[handle] = (
+                merge_recent_ac(handle, submissions) if submissions is not None else None
+            )
+
+    return results
+
+
+async def get_problem_list(skip: int = 0, limit: int = 100):
+    query = gql(
+        """
+    query problemsetQuestionList($categorySlug: String, $limit: Int, $skip: Int, $filters: QuestionListFilterInput) {
+  problemsetQuestionList: questionList(
+    categorySlug: $categorySlug
+    limit: $limit
+    skip: $skip
+    filters: $filters
+  ) {
+    total: totalNum
+    questions: data {
+      acRate
+      difficulty
+      title
+      titleSlug
+      paidOnly: isPaidOnly
+    }
+  }
+}
+    """
+    )
+    result = await execute(
+        query,
+        {
+            "categorySlug": "all-code-essentials",
+            "skip": skip,
+            "limit": limit,
+            "filters": {},
+        },
+        timeout=BACKGROUND_TIMEOUT,
+        priority=PRIORITY_BACKGROUND,
+    )
+    return (
+        result["problemsetQuestionList"]["total"],
+        result["problemsetQuestionList"]["questions"],
+    )
+
+
 async def get_random_problem(difficulty: str = "MEDIUM", retry: int = 0):
     
     if retry > 3:
@@ -104,7 +409,7 @@ async def get_random_problem(difficulty: str = "MEDIUM", retry: int = 0):
 }
     """
     )
-    result = await client.execute_async(
+    result = await execute(
         query,
         {
             "categorySlug": "all-code-essentials",
@@ -114,7 +419,7 @@ async def get_random_problem(difficulty: str = "MEDIUM", retry: int = 0):
         },
     )
     total_problems = result["problemsetQuestionList"]["total"]
-    result = await client.execute_async(
+    result = await execute(
         query,
         {
             "categorySlug": "all-code-essentials",
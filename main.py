@@ -5,18 +5,32 @@ from typing import Literal, Union
 from cachetools import TTLCache
 import discord
 from consts import RANKUP_PROGRESSION
+import battles
 import db
 from discord import app_commands
 from discord.ext import commands
+import jobs
 import lcapi
+import metrics
+import problems
+from scheduler import PRIORITY_BATTLE, PRIORITY_INTERACTIVE
+import state
+from state import DurableCache
+import tracing
 from datetime import datetime, timezone
 import time
 
+from battles import find_winner
 from util import (
+    DeadlineTree,
+    create_battle_result_embed,
     create_embed,
     create_profile_embed,
-    handle_battle_result,
+    defer,
+    finish_command,
+    get_sync_tickets,
     has_active_battle_request,
+    respond,
     user_command,
 )
 from views import BattleCancelRequest, BattleRequest
@@ -26,12 +40,16 @@ bot = commands.Bot(
     command_prefix="/",
     intents=intents,
     case_insensitive=False,
+    tree_cls=DeadlineTree,
 )
-link_cache = TTLCache(maxsize=1024, ttl=300)
-rankup_cache = TTLCache(maxsize=1024, ttl=60 * 20)
-battle_request_cache = TTLCache(maxsize=2048, ttl=120)
-battle_cache = TTLCache(maxsize=2048, ttl=60 * 40)
+link_cache = DurableCache("link", ttl=300)
+rankup_cache = DurableCache("rankup", ttl=60 * 20)
+battle_request_cache = DurableCache("battle_request", ttl=120)
+battle_registry = battles.registry
 battle_cancel_cache = TTLCache(maxsize=2048, ttl=60)
+tree_synced = False
+
+METRICS_SUMMARY_ROWS = 8
 
 
 @bot.tree.command(
@@ -39,17 +57,20 @@ battle_cancel_cache = TTLCache(maxsize=2048, ttl=60)
     description="Pong",
 )
 async def ping(interaction: discord.Interaction):
-    await interaction.response.send_message("Pong!", ephemeral=True)
+    await respond(interaction, "Pong!", ephemeral=True)
 
 
 @bot.tree.command(
-    name="link", description="Link your Discord account to a Leetcode account."
+    name="link",
+    description="Link your Discord account to a Leetcode account.",
+    extras={"ephemeral": True},
 )
 @app_commands.describe(leetcode_username="The Leetcode username to link to.")
 async def link(interaction: discord.Interaction, leetcode_username: str):
     verification_code = str(random.randint(0, 999999)).zfill(6)
     link_cache[interaction.user.id] = (verification_code, leetcode_username)
-    await interaction.response.send_message(
+    await respond(
+        interaction,
         embed=create_embed(
             f"To verify you own this Leetcode account ({leetcode_username}), add `{verification_code}` to your summary and use `/verify`."
         ),
@@ -67,10 +88,11 @@ async def profile(interaction: discord.Interaction):
         "MEDIUM": user_info["mediums"],
         "HARD": user_info["hards"],
     }
-    await interaction.response.send_message(
+    await respond(
+        interaction,
         embed=create_profile_embed(
             user_info, lc_info, interaction.user.name, interaction.user.avatar
-        )
+        ),
     )
 
 
@@ -81,28 +103,24 @@ async def profile(interaction: discord.Interaction):
 @user_command(fetch_lc=True)
 async def sync(interaction: discord.Interaction):
     user_info, lc_info = interaction.data["injected"]
-    await db.sync_solved(interaction.user.id, lc_info)
+    previous = await db.sync_solved(interaction.user.id, lc_info)
 
-    easies_solved = max(0, lc_info["EASY"] - user_info["easies"])
-    mediums_solved = max(0, lc_info["MEDIUM"] - user_info["mediums"])
-    hards_solved = max(0, lc_info["HARD"] - user_info["hards"])
+    easies_solved, mediums_solved, hards_solved, tickets = get_sync_tickets(
+        previous or user_info, lc_info
+    )
 
     easy_suffix = "Easy" if easies_solved == 1 else "Easies"
     medium_suffix = "Medium" if mediums_solved == 1 else "Mediums"
     hard_suffix = "Hard" if hards_solved == 1 else "Hards"
 
-    tickets = easies_solved * 5 + mediums_solved * 10 + hards_solved * 25
-
-    if tickets > 0:
-        await db.set_tickets(interaction.user.id, user_info["tickets"] + tickets)
-
     add_msg = (
         "No change from before."
         if easies_solved + mediums_solved + hards_solved == 0
         else f"You solved **{easies_solved}** {easy_suffix}, **{mediums_solved}** {medium_suffix}, and **{hards_solved}** {hard_suffix}, earning you a total of **{tickets}** tickets."
     )
-    await interaction.response.send_message(
-        embed=create_embed(f"Successfully synced solved questions!\n{add_msg}")
+    await respond(
+        interaction,
+        embed=create_embed(f"Successfully synced solved questions!\n{add_msg}"),
     )
 
 
@@ -113,7 +131,7 @@ async def sync(interaction: discord.Interaction):
 @user_command(fetch_lc=False)
 async def daily(interaction: discord.Interaction):
     user_info, _ = interaction.data["injected"]
-    await interaction.response.defer(thinking=True)
+    await defer(interaction, thinking=True)
 
     daily_question = await lcapi.get_daily_question()
 
@@ -150,11 +168,17 @@ async def daily(interaction: discord.Interaction):
             <= int(submission["timestamp"])
             <= question_interval[1]
         ):
-            await db.set_daily_claimed(interaction.user.id, start_time)
-            await db.set_tickets(interaction.user.id, user_info["tickets"] + tickets)
+            if not await db.claim_daily(interaction.user.id, start_time, tickets):
+                await interaction.followup.send(
+                    embed=create_embed("You already claimed today's daily tickets!")
+                )
+                return
+
+            streak = await db.get_daily_streak(interaction.user.id)
             await interaction.followup.send(
                 embed=create_embed(
                     f"For completing today's daily (**{difficulty}**) with an acceptance rate of **~{round(ac_rate, 2)}%**, you earned **{tickets}** tickets!"
+                    + f"\nDaily streak: **{streak['current_streak']}** (best **{streak['best_streak']}**)"
                 )
             )
             return
@@ -169,10 +193,12 @@ async def daily(interaction: discord.Interaction):
 @bot.tree.command(
     name="verify",
     description="Verify your linked Leetcode account. Only use this after using /link.",
+    extras={"ephemeral": True},
 )
 async def verify(interaction: discord.Interaction):
     if interaction.user.id not in link_cache:
-        await interaction.response.send_message(
+        await respond(
+            interaction,
             embed=create_embed(
                 "You haven't called `/link`, or your verification code has expired. Please `/link` again!"
             ),
@@ -182,7 +208,7 @@ async def verify(interaction: discord.Interaction):
 
     verification_code, leetcode_username = link_cache[interaction.user.id]
 
-    await interaction.response.defer(ephemeral=True)
+    await defer(interaction, ephemeral=True)
 
     summary = await lcapi.get_profile_summary(leetcode_username)
     if verification_code not in summary:
@@ -192,7 +218,9 @@ async def verify(interaction: discord.Interaction):
         )
         return
 
-    solve_count = await lcapi.get_solve_count(leetcode_username)
+    solve_count = await lcapi.get_solve_count(
+        leetcode_username, priority=PRIORITY_INTERACTIVE
+    )
     profile_info = await db.link_id(interaction.user.id, leetcode_username, solve_count)
 
     profile_embed = create_profile_embed(
@@ -208,7 +236,7 @@ async def verify(interaction: discord.Interaction):
 @user_command(fetch_lc=False)
 async def rankup(interaction: discord.Interaction):
     user_info, _ = interaction.data["injected"]
-    await interaction.response.defer(thinking=True)
+    await defer(interaction, thinking=True)
     # if user already called rankup
     if interaction.user.id in rankup_cache:
         recent_ac = await lcapi.get_recent_ac(user_info["leetcode_handle"])
@@ -243,7 +271,7 @@ async def rankup(interaction: discord.Interaction):
                     * base_lp[question_info["difficulty"]]
                 )
                 new_lp = user_info["champion_lp"] + lp_gain
-                await db.set_lp(interaction.user.id, new_lp)
+                await db.add_lp(interaction.user.id, lp_gain)
                 await interaction.followup.send(
                     embed=create_embed(
                         f"Congrats on ranking up! You gained **+{lp_gain}** LP, and now have a total of **{new_lp}** LP."
@@ -272,7 +300,7 @@ async def rankup(interaction: discord.Interaction):
         if user_info["rank"] == "Champion":
             difficulty = random.choice(["MEDIUM", "HARD"])
 
-        question_info = await lcapi.get_random_problem(difficulty=difficulty)
+        question_info = await problems.take_problem(difficulty=difficulty)
 
         if not question_info:
             await interaction.followup.send(
@@ -280,9 +308,9 @@ async def rankup(interaction: discord.Interaction):
             )
             return
 
-        await db.set_tickets(
+        await db.add_tickets(
             interaction.user.id,
-            user_info["tickets"] - RANKUP_PROGRESSION[user_info["rank"]]["ticket_cost"],
+            -RANKUP_PROGRESSION[user_info["rank"]]["ticket_cost"],
         )
         rankup_cache[interaction.user.id] = question_info
         exp_time = int(time.time() + 60 * 20)
@@ -311,31 +339,32 @@ async def battle(
     target_user = user
     user_info, _ = interaction.data["injected"]
     if interaction.user.id == target_user.id:
-        await interaction.response.send_message(
-            embed="You can't battle yourself!", ephemeral=True
-        )
+        await respond(interaction, embed="You can't battle yourself!", ephemeral=True)
         return
 
     if has_active_battle_request(
         battle_request_cache, interaction.user.id, target_user.id
     ):
-        await interaction.response.send_message(
+        await respond(
+            interaction,
             embed="There is still an active battle request with this user!",
             ephemeral=True,
         )
         return
 
-    if interaction.user.id in battle_cache:
-        opponent_id, problem_slug, _, _ = battle_cache[interaction.user.id]
-        await interaction.response.send_message(
-            embed=f"You are still in an active Leetcode battle with <@{opponent_id}>.\nView the problem [here](https://leetcode.com/problems/{problem_slug}).",
+    active_battle = battle_registry.get(interaction.user.id)
+    if active_battle:
+        await respond(
+            interaction,
+            embed=f"You are still in an active Leetcode battle with <@{active_battle.opponent(interaction.user.id)}>.\nView the problem [here](https://leetcode.com/problems/{active_battle.problem_slug}).",
             ephemeral=True,
         )
         return
 
     target_info = await db.get_info(target_user.id)
     if not target_info:
-        await interaction.response.send_message(
+        await respond(
+            interaction,
             embed=create_embed("This user does not have a Leetcode account linked!"),
             ephemeral=True,
         )
@@ -357,7 +386,8 @@ async def battle(
             text="Since you or the requester is a Leetcode Noob, this battle won't have rewards or penalties."
         )
 
-    await interaction.response.send_message(
+    await respond(
+        interaction,
         f"<@{target_user.id}>",
         embed=embed,
         view=BattleRequest(
@@ -366,7 +396,7 @@ async def battle(
             user_info,
             target_info,
             battle_request_cache,
-            battle_cache,
+            battle_registry,
             difficulty,
         ),
     )
@@ -377,61 +407,44 @@ async def battle(
 )
 @user_command(fetch_lc=False)
 async def submit(interaction: discord.Interaction):
-    if interaction.user.id not in battle_cache:
-        await interaction.response.send_message(
+    active_battle = battle_registry.get(interaction.user.id)
+    if not active_battle:
+        await respond(
+            interaction,
             embed=create_embed("You are not in an active Leetcode battle!"),
             ephemeral=True,
         )
         return
 
-    user_info, _ = interaction.data["injected"]
-    opponent_id, problem_slug, problem_difficulty, has_noob = battle_cache[
-        interaction.user.id
-    ]
+    problem_slug = active_battle.problem_slug
 
-    await interaction.response.defer(thinking=True)
+    await defer(interaction, thinking=True)
 
-    recent_ac = await lcapi.get_recent_ac(user_info["leetcode_handle"])
-    if not recent_ac:
+    # earliest accepted submission wins, not whoever ran /submit first
+    submissions = await battle_registry.get_submissions(
+        [active_battle], PRIORITY_BATTLE
+    )
+    winner_id = find_winner(active_battle, submissions)
+    if winner_id is None:
         await interaction.followup.send(
-            embed=create_embed("Your recent submission list is empty.")
+            embed=create_embed(
+                f"You haven't submitted an accepted solution to the battle problem yet.\nComplete the battle problem [here](https://leetcode.com/problems/{problem_slug})."
+            )
         )
         return
 
-    latest_submission = recent_ac[0]
-    if latest_submission["titleSlug"] == problem_slug:
-
-        opponent_info = await db.get_info(opponent_id)
-
-        del battle_cache[interaction.user.id]
-        del battle_cache[opponent_id]
-
-        if not has_noob:
-            result_msg = await handle_battle_result(
-                user_info,
-                opponent_info,
-                problem_difficulty,
-                interaction.user.id,
-                opponent_id,
-            )
-        else:
-            result_msg = (
-                "Nothing happens because one of the users was a Leetcode **Noob**.\n"
-            )
-
+    loser_id = active_battle.opponent(winner_id)
+    result_msg = await battle_registry.resolve(active_battle, winner_id)
+    if result_msg is None:
         await interaction.followup.send(
-            content=f"<@{interaction.user.id}> <@{opponent_id}>",
-            embed=create_embed(
-                title="Leetcode Battle",
-                message=f"<@{interaction.user.id}> won the Leetcode battle against <@{opponent_id}>!\n\n{result_msg}",
-            ),
-        )
-    else:
-        await interaction.followup.send(
-            embed=create_embed(
-                f"Your latest submission is not the battle problem.\nComplete the battle problem [here](https://leetcode.com/problems/{problem_slug})."
-            )
+            embed=create_embed("This Leetcode battle was already resolved!")
         )
+        return
+
+    await interaction.followup.send(
+        content=f"<@{winner_id}> <@{loser_id}>",
+        embed=create_battle_result_embed(winner_id, loser_id, result_msg),
+    )
 
 
 @bot.tree.command(
@@ -440,18 +453,22 @@ async def submit(interaction: discord.Interaction):
 )
 @user_command(fetch_lc=False)
 async def cancel(interaction: discord.Interaction):
-    if not interaction.user.id in battle_cache:
-        await interaction.response.send_message(
-            embed=create_embed("You are not in a Leetcode battle!"), ephemeral=True
+    active_battle = battle_registry.get(interaction.user.id)
+    if not active_battle:
+        await respond(
+            interaction,
+            embed=create_embed("You are not in a Leetcode battle!"),
+            ephemeral=True,
         )
         return
 
-    opponent_id, _, _, _ = battle_cache[interaction.user.id]
+    opponent_id = active_battle.opponent(interaction.user.id)
     if (interaction.user.id, opponent_id) in battle_cancel_cache or (
         opponent_id,
         interaction.user.id,
     ) in battle_cancel_cache:
-        await interaction.response.send_message(
+        await respond(
+            interaction,
             embed=create_embed(
                 "There's already an active cancel request. Please wait until it's responded to, or expires."
             ),
@@ -461,13 +478,14 @@ async def cancel(interaction: discord.Interaction):
 
     battle_cancel_cache[(interaction.user.id, opponent_id)] = True
     exp_time = int(time.time() + 60)
-    await interaction.response.send_message(
+    await respond(
+        interaction,
         content=f"<@{opponent_id}>",
         embed=create_embed(
             f"<@{interaction.user.id}> has requested to cancel the Leetcode battle.\nThis request expires <t:{exp_time}:R>."
         ),
         view=BattleCancelRequest(
-            interaction.user.id, opponent_id, battle_cache, battle_cancel_cache
+            interaction.user.id, opponent_id, battle_registry, battle_cancel_cache
         ),
     )
 
@@ -491,25 +509,146 @@ async def leaderboard(interaction: discord.Interaction):
         title="Leaderboard", message="\n".join(formatted_leaderboard)
     )
     embed.set_footer(text=f"Your rank: {user_rank}/{total_users}")
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
+
+
+def format_latency_rows(rows):
+    lines = [f"{'name':<24} {'n':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'err':>5}"]
+    for name, count, p50, p95, p99, errors in rows:
+        lines.append(
+            f"{name[:24]:<24} {count:>6} {p50 * 1000:>5.0f}ms {p95 * 1000:>5.0f}ms"
+            + f" {p99 * 1000:>5.0f}ms {errors:>5.0%}"
+        )
+    return "```\n" + "\n".join(lines) + "\n```"
+
+
+@bot.tree.command(
+    name="metrics",
+    description="Latency and cache stats for the bot.",
+    extras={"ephemeral": True},
+)
+@app_commands.default_permissions(administrator=True)
+async def show_metrics(interaction: discord.Interaction):
+    permissions = interaction.permissions
+    if not permissions.administrator:
+        await respond(
+            interaction,
+            embed=create_embed("Only server admins can view metrics!"),
+            ephemeral=True,
+        )
+        return
+
+    embed = create_embed(title="Metrics", message="")
+    for title, name, label in (
+        ("Commands", "command", "command"),
+        ("LeetCode", "lcapi_request", "operation"),
+        ("Database reads", "db_query", "query"),
+        ("Database writes", "db_commit", "query"),
+    ):
+        rows = metrics.summarize(name, label)[:METRICS_SUMMARY_ROWS]
+        if rows:
+            embed.add_field(name=title, value=format_latency_rows(rows), inline=False)
+
+    cache_ratios = metrics.cache_ratios()
+    if cache_ratios:
+        embed.add_field(
+            name="Cache hit ratio",
+            value="\n".join(
+                f"{cache}: {ratio:.0%}" for cache, ratio in sorted(cache_ratios.items())
+            ),
+        )
+
+    scheduler_stats = lcapi.scheduler.stats()
+    embed.add_field(
+        name="LeetCode queue",
+        value=f"{scheduler_stats['queue_depth']} queued, {scheduler_stats['in_flight']} in flight"
+        + f"\n{scheduler_stats['retries']} retries, {scheduler_stats['throttled']} throttled",
+    )
+    await respond(interaction, embed=embed, ephemeral=True)
+
+
+@battle_registry.on_expire
+async def announce_expired_battles(expired):
+    by_channel = {}
+    for battle in expired:
+        if battle.channel_id:
+            by_channel.setdefault(battle.channel_id, []).append(battle)
+
+    for channel_id, channel_battles in by_channel.items():
+        channel = bot.get_channel(channel_id)
+        if not channel:
+            continue
+
+        await channel.send(
+            " ".join(
+                f"<@{battle.id_a}> <@{battle.id_b}>" for battle in channel_battles
+            ),
+            embed=create_embed(
+                title="Leetcode Battle",
+                message="\n".join(
+                    f"The Leetcode battle between <@{battle.id_a}> and <@{battle.id_b}> expired."
+                    for battle in channel_battles
+                ),
+            ),
+        )
+
+
+@battle_registry.on_resolve
+async def announce_resolved_battle(battle, winner_id, result_msg):
+    channel = bot.get_channel(battle.channel_id) if battle.channel_id else None
+    if not channel:
+        return
+
+    loser_id = battle.opponent(winner_id)
+    await channel.send(
+        f"<@{winner_id}> <@{loser_id}>",
+        embed=create_battle_result_embed(winner_id, loser_id, result_msg),
+    )
 
 
 @bot.event
 async def on_ready():
-    await bot.tree.sync()
+    global tree_synced
+    jobs.start()
+    # on_ready fires again on every gateway reconnect
+    if not tree_synced:
+        force = bool(os.environ.get("FORCE_SYNC"))
+        if await bot.tree.sync_if_changed(force=force):
+            print("Synced command tree.")
+        tree_synced = True
     print("Ready!")
 
 
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    finish_command(interaction, "ok")
+
+
 @bot.event
 async def on_close():
     await bot.close()
     exit()
 
 
-if __name__ == "__main__":
-    asyncio.run(db.init())
-
+async def main():
     token_file = "test_token" if os.environ.get("TEST_ACCOUNT") else "token"
     with open(token_file, "r") as f:
         token = f.read()
-    bot.run(token)
+
+    await db.init()
+    await state.load()
+    await lcapi.init()
+    await metrics.start_server()
+    try:
+        async with bot:
+            await bot.start(token)
+    finally:
+        await metrics.stop_server()
+        await lcapi.close()
+        await db.close()
+
+
+if __name__ == "__main__":
+    discord.utils.setup_logging()
+    tracing.setup()
+    asyncio.run(main())
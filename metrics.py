@@ -0,0 +1,218 @@
+import bisect
+from collections import deque
+from contextlib import contextmanager
+import functools
+import logging
+import math
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from aiohttp import web
+
+import tracing
+
+log = logging.getLogger(__name__)
+
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# recent samples kept per series for the percentile summary
+RESERVOIR_SIZE = 1024
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def percentile(self, p: float):
+        if not self.samples:
+            return None
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, math.ceil(p * len(samples)) - 1)]
+
+
+histograms: Dict[str, Dict[Labels, Histogram]] = {}
+counters: Dict[str, Dict[Labels, float]] = {}
+# (kind, func) where func returns (name, labels, value) for values owned elsewhere
+collectors: List[Tuple[str, Callable]] = []
+runner: Optional[web.AppRunner] = None
+
+
+def to_labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def observe(name: str, value: float, **labels):
+    series = histograms.setdefault(name, {})
+    key = to_labels(labels)
+    histogram = series.get(key)
+    if histogram is None:
+        histogram = series[key] = Histogram()
+    histogram.observe(value)
+
+
+def inc(name: str, value: float = 1, **labels):
+    series = counters.setdefault(name, {})
+    key = to_labels(labels)
+    series[key] = series.get(key, 0) + value
+
+
+def cache_lookup(cache: str, hit: bool):
+    inc("cache_lookups_total", cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def measure(name: str, **labels):
+    # records latency plus call/error counts as <name>_seconds and <name>_total,
+    # and a span when running inside a traced interaction
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        with tracing.span(name, **labels):
+            yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        observe(f"{name}_seconds", time.perf_counter() - started, **labels)
+        inc(f"{name}_total", status=status, **labels)
+
+
+def timed(name: str, **labels):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapped(*args, **kwargs):
+            with measure(name, **labels):
+                return await func(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
+
+
+def collect(kind: str = "gauge"):
+    def decorator(func):
+        collectors.append((kind, func))
+        return func
+
+    return decorator
+
+
+def format_labels(labels: Labels, extra: Labels = ()):
+    labels = labels + extra
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def render():
+    lines = []
+    for name, series in sorted(counters.items()):
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in series.items():
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+    for name, series in sorted(histograms.items()):
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series.items():
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else str(bound)
+                lines.append(
+                    f"{name}_bucket{format_labels(labels, (('le', le),))} {cumulative}"
+                )
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+    collected: Dict[str, Tuple[str, list]] = {}
+    for kind, func in collectors:
+        try:
+            for name, labels, value in func():
+                collected.setdefault(name, (kind, []))[1].append(
+                    (to_labels(labels), value)
+                )
+        except Exception:
+            log.exception("Metrics collector failed")
+
+    for name, (kind, series) in sorted(collected.items()):
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def cache_ratios():
+    lookups: Dict[str, Dict[str, float]] = {}
+    for labels, value in counters.get("cache_lookups_total", {}).items():
+        labels = dict(labels)
+        lookups.setdefault(labels["cache"], {})[labels["result"]] = value
+
+    return {
+        cache: results.get("hit", 0) / sum(results.values())
+        for cache, results in lookups.items()
+    }
+
+
+def error_rate(name: str, labels: Labels):
+    totals = counters.get(f"{name}_total", {})
+    ok = totals.get(to_labels({**dict(labels), "status": "ok"}), 0)
+    errors = totals.get(to_labels({**dict(labels), "status": "error"}), 0)
+    return errors / (ok + errors) if ok + errors else 0
+
+
+def summarize(name: str, label: str):
+    rows = []
+    for labels, histogram in histograms.get(f"{name}_seconds", {}).items():
+        rows.append(
+            (
+                dict(labels).get(label, "?"),
+                histogram.count,
+                histogram.percentile(0.5),
+                histogram.percentile(0.95),
+                histogram.percentile(0.99),
+                error_rate(name, labels),
+            )
+        )
+    return sorted(rows, key=lambda row: row[1], reverse=True)
+
+
+async def handle_metrics(request: web.Request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    global runner
+    if not port:
+        return
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info("Serving metrics on http://%s:%s/metrics", host, port)
+
+
+async def stop_server():
+    global runner
+    if runner:
+        await runner.cleanup()
+    runner = None
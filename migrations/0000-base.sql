@@ -0,0 +1,15 @@
+CREATE TABLE IF NOT EXISTS users (
+    discord_id INTEGER PRIMARY KEY,
+    leetcode_handle TEXT,
+    rank TEXT,
+    tickets INTEGER,
+    easies INTEGER,
+    mediums INTEGER,
+    hards INTEGER,
+    champion_lp INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS daily_claims (
+    discord_id INTEGER,
+    daily_start_time INTEGER
+);
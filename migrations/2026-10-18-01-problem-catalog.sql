@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS problems (
+    title_slug TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    ac_rate REAL NOT NULL,
+    paid_only INTEGER NOT NULL,
+    fetched_at INTEGER NOT NULL
+);
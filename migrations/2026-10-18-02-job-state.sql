@@ -0,0 +1,4 @@
+CREATE TABLE IF NOT EXISTS job_state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
@@ -0,0 +1,11 @@
+ALTER TABLE users ADD COLUMN rank_value INTEGER GENERATED ALWAYS AS (
+    CASE rank
+        WHEN 'Champion' THEN 4
+        WHEN 'Master' THEN 3
+        WHEN 'Pro' THEN 2
+        ELSE 1
+    END
+) VIRTUAL;
+
+CREATE INDEX IF NOT EXISTS users_leaderboard
+    ON users (rank_value, champion_lp, tickets, discord_id, rank);
@@ -0,0 +1,8 @@
+-- keep the first claim of any duplicates so the unique index can be built
+DELETE FROM daily_claims
+WHERE rowid NOT IN (
+    SELECT MIN(rowid) FROM daily_claims GROUP BY discord_id, daily_start_time
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS daily_claims_user_day
+    ON daily_claims (discord_id, daily_start_time);
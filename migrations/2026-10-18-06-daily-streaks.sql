@@ -0,0 +1,45 @@
+CREATE TABLE IF NOT EXISTS daily_streaks (
+    discord_id INTEGER PRIMARY KEY,
+    last_claimed INTEGER NOT NULL,
+    current_streak INTEGER NOT NULL,
+    best_streak INTEGER NOT NULL,
+    total_claims INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS daily_claims_archive (
+    discord_id INTEGER NOT NULL,
+    daily_start_time INTEGER NOT NULL,
+    PRIMARY KEY (discord_id, daily_start_time)
+) WITHOUT ROWID;
+
+-- consecutive days share day - row_number, each group is one streak
+WITH days AS (
+    SELECT
+        discord_id,
+        daily_start_time,
+        daily_start_time / 86400 - ROW_NUMBER() OVER (
+            PARTITION BY discord_id ORDER BY daily_start_time
+        ) AS island
+    FROM daily_claims
+),
+streaks AS (
+    SELECT discord_id, COUNT(*) AS length, MAX(daily_start_time) AS last_day
+    FROM days
+    GROUP BY discord_id, island
+)
+INSERT OR REPLACE INTO daily_streaks (
+    discord_id, last_claimed, current_streak, best_streak, total_claims
+)
+SELECT
+    discord_id,
+    MAX(last_day),
+    (
+        SELECT latest.length FROM streaks AS latest
+        WHERE latest.discord_id = streaks.discord_id
+        ORDER BY latest.last_day DESC
+        LIMIT 1
+    ),
+    MAX(length),
+    SUM(length)
+FROM streaks
+GROUP BY discord_id;
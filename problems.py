@@ -0,0 +1,111 @@
+from collections import deque
+import random
+import time
+from typing import Deque, Dict, List
+
+import db
+import lcapi
+
+PAGE_SIZE = 100
+CATALOG_TTL = 60 * 60 * 24
+POOL_SIZE = 20
+POOL_LOW_WATER = 5
+
+# difficulty -> "free" / "paid" -> problems
+index: Dict[str, Dict[str, List[dict]]] = {}
+refreshed_at = 0
+
+pools: Dict[str, Deque[dict]] = {
+    "EASY": deque(),
+    "MEDIUM": deque(),
+    "HARD": deque(),
+}
+
+
+def build_index(problems: List[dict]):
+    global index
+    new_index = {}
+    for problem in problems:
+        bucket = new_index.setdefault(
+            problem["difficulty"].upper(), {"free": [], "paid": []}
+        )
+        bucket["paid" if problem["paidOnly"] else "free"].append(problem)
+    index = new_index
+
+
+def is_stale():
+    return not index or time.time() - refreshed_at > CATALOG_TTL
+
+
+async def load():
+    global refreshed_at
+    problems = await db.get_problems()
+    build_index(problems)
+    refreshed_at = max((problem["fetchedAt"] for problem in problems), default=0)
+
+
+async def refresh():
+    global refreshed_at
+    problems = []
+    total = None
+    while total is None or len(problems) < total:
+        total, page = await lcapi.get_problem_list(skip=len(problems), limit=PAGE_SIZE)
+        if not page:
+            break
+        problems.extend(page)
+
+    if not problems:
+        return
+
+    fetched_at = int(time.time())
+    await db.replace_problems(problems, fetched_at)
+    build_index(problems)
+    refreshed_at = fetched_at
+    fill_pools()
+
+
+def pick_from_catalog(difficulty: str):
+    free_problems = index.get(difficulty, {}).get("free")
+    if not free_problems:
+        return None
+    return random.choice(free_problems)
+
+
+async def get_random_problem(difficulty: str = "MEDIUM"):
+    problem = pick_from_catalog(difficulty)
+    if problem:
+        return problem
+
+    # catalog hasn't been loaded yet
+    return await lcapi.get_random_problem(difficulty=difficulty)
+
+
+def refill_pool(difficulty: str):
+    # pools only ever come from the catalog, an empty one waits for refresh()
+    # rather than spending LeetCode requests on a buffer
+    pool = pools[difficulty]
+    while len(pool) < POOL_SIZE:
+        problem = pick_from_catalog(difficulty)
+        if not problem:
+            break
+        pool.append(problem)
+
+
+def fill_pools():
+    for difficulty in pools:
+        refill_pool(difficulty)
+
+
+async def take_problem(difficulty: str = "MEDIUM"):
+    pool = pools.get(difficulty)
+    if pool is None:
+        return await get_random_problem(difficulty=difficulty)
+
+    problem = pool.popleft() if pool else None
+    if len(pool) <= POOL_LOW_WATER:
+        refill_pool(difficulty)
+    if problem:
+        return problem
+
+    # pool ran dry, fall through to a direct pick
+    return await get_random_problem(difficulty=difficulty)
@@ -0,0 +1,138 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import List, Optional, Tuple
+from gql.transport.exceptions import TransportServerError
+
+log = logging.getLogger(__name__)
+
+PRIORITY_BATTLE = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_SYNC = 2
+PRIORITY_BACKGROUND = 3
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class Scheduler:
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        max_in_flight: int,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 10,
+        saturation_depth: int = 50,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.saturation_depth = saturation_depth
+
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.counter = itertools.count()
+        self.wakeup: Optional[asyncio.TimerHandle] = None
+        self.saturated = False
+        self.retries = 0
+        self.throttled = 0
+
+    def queue_depth(self):
+        return len(self.waiters)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth(),
+            "in_flight": self.in_flight,
+            "tokens": self.tokens,
+            "retries": self.retries,
+            "throttled": self.throttled,
+        }
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wake(self):
+        self.wakeup = None
+        self.dispatch()
+
+    def dispatch(self):
+        self.refill()
+        while self.waiters and self.in_flight < self.max_in_flight:
+            future = self.waiters[0][2]
+            if future.done():
+                # caller gave up while queued
+                heapq.heappop(self.waiters)
+                continue
+
+            if self.tokens < 1:
+                if self.wakeup is None:
+                    delay = (1 - self.tokens) / self.rate
+                    self.wakeup = asyncio.get_running_loop().call_later(
+                        delay, self.wake
+                    )
+                return
+
+            heapq.heappop(self.waiters)
+            self.tokens -= 1
+            self.in_flight += 1
+            future.set_result(None)
+
+        if not self.waiters:
+            self.saturated = False
+
+    async def acquire(self, priority: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), future))
+        self.dispatch()
+
+        if not self.saturated and self.queue_depth() >= self.saturation_depth:
+            self.saturated = True
+            log.warning("LeetCode request queue is saturated: %s", self.stats())
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # slot was granted right before cancellation
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self.dispatch()
+
+    def backoff(self, attempt: int):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def run(self, func, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        attempt = 0
+        while True:
+            await self.acquire(priority)
+            try:
+                return await func(*args, **kwargs)
+            except TransportServerError as e:
+                if e.code not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                    raise
+
+                if e.code == 429:
+                    # back off everyone, not just this caller
+                    self.throttled += 1
+                    self.tokens = min(self.tokens, 0)
+            finally:
+                self.release()
+
+            self.retries += 1
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
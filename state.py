@@ -0,0 +1,105 @@
+import asyncio
+from collections.abc import MutableMapping
+import json
+import logging
+import time
+from typing import Any, Dict, Tuple
+
+import db
+
+log = logging.getLogger(__name__)
+
+stores: Dict[str, "DurableCache"] = {}
+
+
+def watch(write: asyncio.Future, action: str, kind: str, key: str):
+    # writes are fire and forget, but a lost one should still show up in the logs
+    def done(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            log.error(
+                "Failed to %s %s state %s",
+                action,
+                kind,
+                key,
+                exc_info=future.exception(),
+            )
+
+    write.add_done_callback(done)
+    return write
+
+
+def encode(value: Any):
+    return json.dumps(value, separators=(",", ":"))
+
+
+def decode(value: str):
+    # json turns tuples into lists, and tuple keys need to stay hashable
+    def to_tuple(item):
+        if isinstance(item, list):
+            return tuple(to_tuple(i) for i in item)
+        return item
+
+    return to_tuple(json.loads(value))
+
+
+class DurableCache(MutableMapping):
+    def __init__(self, kind: str, ttl: float):
+        self.kind = kind
+        self.ttl = ttl
+        self.items: Dict[Any, Tuple[Any, float]] = {}
+        stores[kind] = self
+
+    def __getitem__(self, key):
+        value, expires_at = self.items[key]
+        if expires_at <= time.time():
+            # the row itself is cleaned up by purge()
+            del self.items[key]
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        expires_at = time.time() + self.ttl
+        self.items[key] = (value, expires_at)
+        key = encode(key)
+        watch(
+            db.put_state(self.kind, key, encode(value), expires_at),
+            "save",
+            self.kind,
+            key,
+        )
+
+    def __delitem__(self, key):
+        del self.items[key]
+        key = encode(key)
+        watch(db.delete_state(self.kind, key), "delete", self.kind, key)
+
+    def __iter__(self):
+        now = time.time()
+        return iter([key for key, (_, exp) in self.items.items() if exp > now])
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def expires_at(self, key):
+        return self.items[key][1]
+
+    def restore(self, key, value, expires_at: float):
+        self.items[key] = (value, expires_at)
+
+    def expire(self, now: float):
+        for key in [key for key, (_, exp) in self.items.items() if exp <= now]:
+            del self.items[key]
+
+
+async def load():
+    for kind, key, value, expires_at in await db.load_state(time.time()):
+        store = stores.get(kind)
+        if store is not None:
+            store.restore(decode(key), decode(value), expires_at)
+
+
+async def purge():
+    now = time.time()
+    for store in stores.values():
+        store.expire(now)
+    await db.purge_state(now)
@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+import os
+import secrets
+import time
+from typing import List, Optional
+
+log = logging.getLogger(__name__)
+trace_log = logging.getLogger("traces")
+trace_log.propagate = False
+
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUPS = 5
+SLOW_COMMAND_THRESHOLD = float(os.environ.get("SLOW_COMMAND_THRESHOLD", "2"))
+
+current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "attrs",
+        "trace_id",
+        "span_id",
+        "parent",
+        "root",
+        "spans",
+        "started_at",
+        "start",
+        "duration",
+        "status",
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.root = parent.root if parent else self
+        self.trace_id = self.root.span_id
+        # only the root collects its trace, children append to it
+        self.spans: List[Span] = []
+        self.root.spans.append(self)
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status = "ok"
+
+    def finish(self, status: Optional[str] = None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.start
+        if status:
+            self.status = status
+        if self.root is self:
+            record(self)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "start": self.started_at,
+            "duration_ms": (
+                round(self.duration * 1000, 3) if self.duration is not None else None
+            ),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+def setup(
+    path: str = TRACE_FILE,
+    max_bytes: int = TRACE_MAX_BYTES,
+    backups: int = TRACE_BACKUPS,
+):
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_log.addHandler(handler)
+    trace_log.setLevel(logging.INFO)
+
+
+def start_trace(name: str, **attrs):
+    # the caller finishes the root span, it can outlive the current context
+    root = Span(name, **attrs)
+    current_span.set(root)
+    return root
+
+
+@contextmanager
+def span(name: str, **attrs):
+    parent = current_span.get()
+    if parent is None or parent.root.duration is not None:
+        # not part of an interaction, background work isn't traced
+        yield None
+        return
+
+    child = Span(name, parent, **attrs)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException:
+        child.status = "error"
+        raise
+    finally:
+        current_span.reset(token)
+        child.finish()
+
+
+def format_tree(root: Span):
+    children = {}
+    for item in root.spans:
+        if item.parent:
+            children.setdefault(item.parent.span_id, []).append(item)
+
+    lines = []
+
+    def walk(item: Span, depth: int):
+        attrs = " ".join(f"{key}={value}" for key, value in item.attrs.items())
+        duration = (
+            f"{item.duration * 1000:.1f}ms" if item.duration is not None else "running"
+        )
+        lines.append(f"{'  ' * depth}{item.name} {duration} {item.status} {attrs}")
+        for child in sorted(children.get(item.span_id, []), key=lambda s: s.start):
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def record(root: Span):
+    if trace_log.handlers:
+        trace_log.info(
+            json.dumps(
+                {
+                    "trace_id": root.trace_id,
+                    "spans": [item.to_dict() for item in root.spans],
+                },
+                default=str,
+                separators=(",", ":"),
+            )
+        )
+
+    if root.duration >= SLOW_COMMAND_THRESHOLD:
+        log.warning(
+            "Slow interaction %s took %.0fms\n%s",
+            root.name,
+            root.duration * 1000,
+            format_tree(root),
+        )
@@ -1,12 +1,146 @@
+import asyncio
+from collections import Counter
+from collections.abc import MutableMapping
 import functools
+import hashlib
+import json
 import random
+import time
 from typing import Optional
-from cachetools import TTLCache
 import discord
+from discord import app_commands
 
 from consts import RANK_VALUE, RANKDOWN_PROGRESSION, RANKUP_PROGRESSION
 import db
 import lcapi
+import metrics
+import tracing
+
+# discord drops interactions that aren't answered within 3 seconds
+INTERACTION_DEADLINE = 3
+AUTO_DEFER_THRESHOLD = 1
+COMMAND_TREE_HASH_JOB = "command_tree_hash"
+
+command_counts = Counter()
+auto_defer_counts = Counter()
+
+
+def response_lock(interaction: discord.Interaction) -> asyncio.Lock:
+    return interaction.extras.setdefault("response_lock", asyncio.Lock())
+
+
+async def defer(interaction: discord.Interaction, **kwargs):
+    async with response_lock(interaction):
+        if interaction.response.is_done():
+            return False
+        with metrics.measure("discord_response", kind="defer"):
+            await interaction.response.defer(**kwargs)
+        return True
+
+
+async def respond(interaction: discord.Interaction, *args, **kwargs):
+    async with response_lock(interaction):
+        if interaction.response.is_done():
+            # the first followup after a public auto-defer takes over its
+            # "thinking" message and ignores ephemeral, so clear that message
+            # first and the followup goes out as a private message of its own
+            if interaction.extras.pop("public_defer", False) and kwargs.get(
+                "ephemeral"
+            ):
+                try:
+                    await interaction.delete_original_response()
+                except discord.HTTPException:
+                    pass
+            with metrics.measure("discord_response", kind="followup"):
+                return await interaction.followup.send(*args, **kwargs)
+        with metrics.measure("discord_response", kind="response"):
+            return await interaction.response.send_message(*args, **kwargs)
+
+
+def finish_command(interaction: discord.Interaction, status: str):
+    timer = interaction.extras.get("auto_defer")
+    if timer:
+        timer.cancel()
+
+    started_at = interaction.extras.get("started_at")
+    if started_at is not None and interaction.command is not None:
+        name = interaction.command.qualified_name
+        metrics.observe(
+            "command_seconds", time.perf_counter() - started_at, command=name
+        )
+        metrics.inc("command_total", command=name, status=status)
+
+    trace = interaction.extras.get("trace")
+    if trace:
+        trace.finish(status)
+
+
+@metrics.collect("counter")
+def collect_command_counts():
+    return [
+        ("command_auto_defers_total", {"command": name}, count)
+        for name, count in auto_defer_counts.items()
+    ]
+
+
+async def auto_defer(interaction: discord.Interaction, name: str, ephemeral: bool):
+    deadline = interaction.created_at.timestamp() + INTERACTION_DEADLINE
+    # don't trust a skewed clock to give us more than discord does
+    delay = min(deadline - time.time(), INTERACTION_DEADLINE) - AUTO_DEFER_THRESHOLD
+    await asyncio.sleep(max(0, delay))
+    if await defer(interaction, ephemeral=ephemeral, thinking=True):
+        auto_defer_counts[name] += 1
+        interaction.extras["public_defer"] = not ephemeral
+
+
+class DeadlineTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction, /):
+        command = interaction.command
+        if (
+            interaction.type is discord.InteractionType.application_command
+            and command is not None
+        ):
+            name = command.qualified_name
+            command_counts[name] += 1
+            interaction.extras["started_at"] = time.perf_counter()
+            interaction.extras["trace"] = tracing.start_trace(
+                name,
+                interaction_id=interaction.id,
+                user_id=interaction.user.id,
+                guild_id=interaction.guild_id,
+            )
+            interaction.extras["auto_defer"] = asyncio.create_task(
+                auto_defer(interaction, name, command.extras.get("ephemeral", False))
+            )
+        return True
+
+    def command_hash(self):
+        payload = sorted(
+            (
+                command.to_dict(self)
+                for command_type in discord.AppCommandType
+                for command in self.get_commands(type=command_type)
+            ),
+            key=lambda command: (command["type"], command["name"]),
+        )
+        return hashlib.sha256(
+            json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+        ).hexdigest()
+
+    async def sync_if_changed(self, force: bool = False):
+        # global syncs are slow and heavily rate limited, only push real changes
+        job_name = f"{COMMAND_TREE_HASH_JOB}:{self.client.application_id}"
+        command_hash = self.command_hash()
+        if not force and await db.get_job_cursor(job_name) == command_hash:
+            return False
+
+        await self.sync()
+        await db.set_job_state(job_name, command_hash)
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error, /):
+        finish_command(interaction, "error")
+        await super().on_error(interaction, error)
 
 
 def create_embed(message: str, title: Optional[str] = None):
@@ -17,6 +151,13 @@ def create_embed(message: str, title: Optional[str] = None):
     return embed
 
 
+def create_battle_result_embed(winner_id: int, loser_id: int, result_msg: str):
+    return create_embed(
+        title="Leetcode Battle",
+        message=f"<@{winner_id}> won the Leetcode battle against <@{loser_id}>!\n\n{result_msg}",
+    )
+
+
 def create_profile_embed(info: dict, lc_info: dict, title: str, avatar):
     embed = discord.Embed(color=0xFFAE00)
     embed.title = title
@@ -49,6 +190,14 @@ def create_profile_embed(info: dict, lc_info: dict, title: str, avatar):
     return embed
 
 
+def get_sync_tickets(user_info: dict, lc_info: dict):
+    easies_solved = max(0, lc_info["EASY"] - user_info["easies"])
+    mediums_solved = max(0, lc_info["MEDIUM"] - user_info["mediums"])
+    hards_solved = max(0, lc_info["HARD"] - user_info["hards"])
+    tickets = easies_solved * 5 + mediums_solved * 10 + hards_solved * 25
+    return easies_solved, mediums_solved, hards_solved, tickets
+
+
 def user_command(fetch_lc=False):
     def wrapper(func):
         @functools.wraps(func)
@@ -56,7 +205,8 @@ def user_command(fetch_lc=False):
             user_data = await db.get_info(interaction.user.id)
 
             async def noop(interaction: discord.Interaction, *args, **kwargs):
-                await interaction.response.send_message(
+                await respond(
+                    interaction,
                     embed=create_embed("You don't have an account linked!"),
                     ephemeral=True,
                 )
@@ -78,7 +228,7 @@ def user_command(fetch_lc=False):
     return wrapper
 
 
-def has_active_battle_request(cache: TTLCache, id_a: int, id_b: int):
+def has_active_battle_request(cache: MutableMapping, id_a: int, id_b: int):
     key = (id_a, id_b)
     rev_key = (id_b, id_a)
 
@@ -114,24 +264,26 @@ async def handle_battle_result(
     result_msg = ""
     lp_delta = get_lp_delta(user_info, opponent_info, problem_difficulty)
 
-    await db.set_wins(user_id, user_info["wins"] + 1)
-    await db.set_losses(opponent_id, opponent_info["losses"] + 1)
+    async with db.transaction("handle_battle_result") as tx:
+        tx.add_wins(user_id)
+        tx.add_losses(opponent_id)
+
+        if opponent_info["rank"] == "Noob" or user_info["rank"] == "Noob":
+            result_msg = "Nothing happens because someone is a Noob."
+            return result_msg
 
-    if opponent_info["rank"] == "Noob" or user_info["rank"] == "Noob":
-        result_msg = "Nothing happens because someone is a Noob."
-    else:
         # handle opponent losses
         if opponent_info["rank"] == "Champion":
             result_msg += f"<@{opponent_id}> lost **{lp_delta}** LP.\n"
             if opponent_info["champion_lp"] - lp_delta < 0:
-                await db.set_lp(opponent_id, 0)
-                await db.set_rank(opponent_id, "Master")
+                tx.set_lp(opponent_id, 0)
+                tx.set_rank(opponent_id, "Master")
                 result_msg += f"<@{opponent_id}>'s LP fell below 0, so they are now a Leetcode **Master**.\n"
             else:
-                await db.set_lp(opponent_id, opponent_info["champion_lp"] - lp_delta)
+                tx.add_lp(opponent_id, -lp_delta)
         else:
             # rank loss
-            await db.set_rank(opponent_id, RANKDOWN_PROGRESSION[opponent_info["rank"]])
+            tx.set_rank(opponent_id, RANKDOWN_PROGRESSION[opponent_info["rank"]])
             result_msg += f"<@{opponent_id}> is now a Leetcode **{RANKDOWN_PROGRESSION[opponent_info["rank"]]}**.\n"
 
         # handle user gains
@@ -139,14 +291,14 @@ async def handle_battle_result(
             lp_delta = get_lp_delta(user_info, opponent_info, problem_difficulty)
 
             result_msg += f"<@{user_id}> gained **{lp_delta}** LP.\n"
-            await db.set_lp(user_id, user_info["champion_lp"] + lp_delta)
+            tx.add_lp(user_id, lp_delta)
         else:
             rank_polarity = (
                 RANK_VALUE[user_info["rank"]] - RANK_VALUE[opponent_info["rank"]]
             )
             # lower rank than opponent
             if rank_polarity < 0:
-                await db.set_rank(
+                tx.set_rank(
                     user_id,
                     RANKUP_PROGRESSION[user_info["rank"]]["next_rank"],
                 )
@@ -158,10 +310,7 @@ async def handle_battle_result(
                     "Medium": 20,
                     "Hard": 35,
                 }
-                await db.set_tickets(
-                    user_id,
-                    user_info["tickets"] + base_difficulty_tickets[problem_difficulty],
-                )
+                tx.add_tickets(user_id, base_difficulty_tickets[problem_difficulty])
                 result_msg += f"<@{user_id}> gains **{base_difficulty_tickets[problem_difficulty]}** tickets."
 
     return result_msg
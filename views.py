@@ -1,16 +1,15 @@
-import time
 import discord
 
 import db
-import lcapi
+import problems
 from util import create_embed
 
 
 class BattleCancelRequest(discord.ui.View):
-    def __init__(self, id_a: int, id_b: int, battle_cache, battle_cancel_cache):
+    def __init__(self, id_a: int, id_b: int, battle_registry, battle_cancel_cache):
         self.id_a = id_a
         self.id_b = id_b
-        self.battle_cache = battle_cache
+        self.battle_registry = battle_registry
         self.battle_cancel_cache = battle_cancel_cache
         super().__init__(timeout=60)
 
@@ -22,11 +21,9 @@ class BattleCancelRequest(discord.ui.View):
     @discord.ui.button(label="Accept", style=discord.ButtonStyle.green)
     async def accept(self, interaction: discord.Interaction, _):
 
-        if self.id_a in self.battle_cache:
-            del self.battle_cache[self.id_a]
-
-        if self.id_b in self.battle_cache:
-            del self.battle_cache[self.id_b]
+        battle = self.battle_registry.get(self.id_a)
+        if battle and battle.opponent(self.id_a) == self.id_b:
+            self.battle_registry.remove(battle)
 
         if (self.id_a, self.id_b) in self.battle_cancel_cache:
             del self.battle_cancel_cache[(self.id_a, self.id_b)]
@@ -61,7 +58,7 @@ class BattleRequest(discord.ui.View):
         a_info: dict,
         b_info: dict,
         request_cache,
-        battle_cache,
+        battle_registry,
         difficulty: str,
     ):
         self.id_a = id_a
@@ -69,7 +66,7 @@ class BattleRequest(discord.ui.View):
         self.a_info = a_info
         self.b_info = b_info
         self.request_cache = request_cache
-        self.battle_cache = battle_cache
+        self.battle_registry = battle_registry
         self.difficulty = difficulty
         super().__init__(timeout=120)
 
@@ -83,29 +80,25 @@ class BattleRequest(discord.ui.View):
         if (self.id_a, self.id_b) in self.request_cache:
             del self.request_cache[(self.id_a, self.id_b)]
 
-        if self.id_a in self.battle_cache or self.id_b in self.battle_cache:
+        if self.battle_registry.get(self.id_a) or self.battle_registry.get(self.id_b):
             await interaction.response.send_message(embed=create_embed("One or more users are already in a battle."))
             self.stop()
             return
         
         await interaction.response.defer(thinking=True)
-        problem = await lcapi.get_random_problem(difficulty=self.difficulty.upper())
+        problem = await problems.take_problem(difficulty=self.difficulty.upper())
 
         has_noob = self.a_info["rank"] == "Noob" or self.b_info["rank"] == "Noob"
 
-        self.battle_cache[self.id_a] = (
-            self.id_b,
-            problem["titleSlug"],
-            problem["difficulty"],
-            has_noob,
-        )
-        self.battle_cache[self.id_b] = (
+        battle = self.battle_registry.add(
             self.id_a,
+            self.id_b,
             problem["titleSlug"],
             problem["difficulty"],
             has_noob,
+            interaction.channel_id,
         )
-        exp_time = int(time.time() + 60 * 40)
+        exp_time = int(battle.expires_at)
         await interaction.followup.send(
             f"<@{self.id_a}> <@{self.id_b}>",
             embed=create_embed(